@@ -0,0 +1,279 @@
+"""Benchmark the detection primitives against recorded screenshots
+
+The corpus is a folder per resolution (e.g. corpus/423x726/, any size the
+bot can play) of game screenshots, as saved by --record, with an optional
+labels.json:
+
+    {"frame-000001.png": {"window": "SHAFT",
+                          "templates": {"shovel.png": [119, 118], "free.png": null},
+                          "ocr": {"manager_heading": "managerjohn"}}}
+
+Template labels are the expected center of a hit (null for "not there"),
+OCR labels the text as Region.ocr returns it (lowercase, no spaces or
+periods). No emulator is needed, frames are served by a ReplayBackend.
+OCR is timed and scored with the real engine, which needs Windows and
+screen_ocr; without it the ocr rows are left out rather than timing the
+recorded answers.
+
+--check-coarse matches every template against every frame with and without
+the half-size search instead of timing anything, and fails if any result
+differs. Run it after changing the coarse search or its COARSE_ settings.
+
+python -m idle_miner_tycoon.benchmark corpus --save-baseline baseline.json
+python -m idle_miner_tycoon.benchmark corpus --baseline baseline.json
+python -m idle_miner_tycoon.benchmark corpus --check-coarse
+"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import time
+from collections import defaultdict
+import numpy as np
+from . import idle_miner_tycoon as imt
+
+# Pixels a hit may be off from its labelled center and still count
+HIT_TOLERANCE = 10
+# Confidences the coarse search is checked at, the bot's default and locate_all's
+CHECK_CONFIDENCES = (0.7, 0.8)
+
+
+class Results:
+    """Latencies and accuracy counts per detector"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)  # detector: [seconds]
+        self.accuracy = defaultdict(lambda: [0, 0])  # detector: [correct, labelled]
+
+    def time(self, detector, func, *args, **kwargs):
+        """Run func, recording how long it took under detector"""
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.latencies[detector].append(time.perf_counter() - start)
+        return result
+
+    def score(self, detector, correct):
+        """Record whether a labelled result was right"""
+        self.accuracy[detector][0] += bool(correct)
+        self.accuracy[detector][1] += 1
+
+    def summary(self):
+        """{detector: stats}, latencies in milliseconds"""
+        summary = {}
+        for detector, latencies in sorted(self.latencies.items()):
+            ms = np.array(latencies) * 1000
+            stats = {
+                "n": len(ms),
+                "p50": float(np.percentile(ms, 50)),
+                "p90": float(np.percentile(ms, 90)),
+                "p99": float(np.percentile(ms, 99)),
+                "max": float(ms.max()),
+                "fps": float(1000 / ms.mean()) if ms.mean() else float("inf"),
+            }
+            correct, labelled = self.accuracy.get(detector, (0, 0))
+            if labelled:
+                stats["accuracy"] = correct / labelled
+            summary[detector] = stats
+        return summary
+
+
+class EngineReplayBackend(imt.ReplayBackend):
+    """Recorded frames, with text read by the real OCR engine instead of ocr.json"""
+
+    def ocr(self, pixels):
+        return imt.WindowsBackend.read_text(pixels)
+
+
+def ocr_engine_available():
+    """True if the real OCR engine can run here"""
+    return imt.Image is not None and importlib.util.find_spec("screen_ocr") is not None
+
+
+def hit_is_correct(loc, expected):
+    """Compare a find_image result with a label ([x, y] or None)"""
+    if expected is None or loc is None:
+        return expected is None and loc is None
+    return (abs(loc.x - expected[0]) <= HIT_TOLERANCE
+            and abs(loc.y - expected[1]) <= HIT_TOLERANCE)
+
+
+def bench_frame(bot, results, labels):
+    """Run every detector against the current frame"""
+    screen = bot.screen
+    screen.invalidate()
+    results.time("capture", screen.frame)
+    expected = labels.get("templates", {})
+    for name in imt.TEMPLATE_NAMES:
+        if name not in screen.templates:
+            continue
+        loc = results.time(f"find_image:{name}", bot.find_image, name)
+        if name in expected:
+            results.score(f"find_image:{name}", hit_is_correct(loc, expected[name]))
+    for name in ("level.png", "assign.png"):
+        if name in screen.templates:
+            results.time(f"locate_all:{name}", bot.locate_all, name, confidence=0.7)
+    hits = results.time("find_images:always_buttons", bot.find_images, bot.always_buttons)
+    labelled = [name for name in bot.always_buttons if name in expected]
+    if labelled:
+        results.score("find_images:always_buttons", all(
+            hit_is_correct(hits.get(name), expected[name]) for name in labelled))
+    # The manager readiness probe, a 6x6 grid under five buttons
+    grid = np.array([(x, y) for x in range(0, 24, 4) for y in range(0, 24, 4)])
+    points = np.concatenate([grid + (100, 150 + 115 * i) for i in range(5)])
+    points = np.round(points * screen.scale).astype(int)
+    results.time("sample:manager_grid", screen.sample, points)
+    results.time("get_color", imt.Loc(174, 273).get_color)
+    if isinstance(screen.backend, EngineReplayBackend):
+        for name, region in (("manager_heading", bot.region_manager_chooser_heading),
+                             ("overview_heading", imt.Region(95, 95, 275, 125))):
+            imt.OCR_CACHE.clear()  # Measure misses
+            text = results.time(f"ocr:{name}", region.ocr)
+            if name in labels.get("ocr", {}):
+                results.score(f"ocr:{name}", text == labels["ocr"][name])
+    window, _ = results.time("classify_screen", bot.classify_screen)
+    if "window" in labels:
+        results.score("classify_screen",
+                      window is not None and window.name == labels["window"])
+
+
+def bench_resolution(folder, repeat, ocr_engine):
+    """Benchmark every frame in one resolution folder"""
+    backend_class = EngineReplayBackend if ocr_engine else imt.ReplayBackend
+    backend = backend_class(folder, advance="none")
+    bot = imt.IdleMinerTycoon(imt.connect(backend), name="benchmark")
+    # Learn search regions from this corpus only, and don't save them
+    bot.search_regions = imt.SearchRegions(pad=round(20 * bot.screen.scale))
+    labels = {}
+    labels_path = os.path.join(folder, "labels.json")
+    if os.path.exists(labels_path):
+        with open(labels_path, encoding="utf-8") as f:
+            labels = json.load(f)
+    # Teach the classifier the labelled frames so it's measured like it runs
+    for index, path in enumerate(backend.paths):
+        window = labels.get(os.path.basename(path), {}).get("window")
+        if window:
+            backend.seek(index)
+            bot.screen.invalidate()
+            frame, _ = bot.screen.crop(bot.region_game.box())
+            bot.screen_classifier.learn(imt.Window[window], frame)
+    results = Results()
+    for _ in range(repeat):
+        for index, path in enumerate(backend.paths):
+            backend.seek(index)
+            bench_frame(bot, results, labels.get(os.path.basename(path), {}))
+    return results.summary()
+
+
+def check_coarse(folder):
+    """Compare coarse and full resolution matching on every frame and template
+
+    Returns the number of comparisons and a (frame, template, confidence,
+    limit, full, coarse) tuple for each one that differs.
+    """
+    backend = imt.ReplayBackend(folder, advance="none")
+    bot = imt.IdleMinerTycoon(imt.connect(backend), name="benchmark")
+    screen = bot.screen
+    names = [name for name in imt.TEMPLATE_NAMES if name in screen.templates]
+    checked, mismatches = 0, []
+    for index, path in enumerate(backend.paths):
+        backend.seek(index)
+        screen.invalidate()
+        haystack, _ = screen.crop(bot.region_game.box())
+        for name in names:
+            needle = screen.templates.get(name)
+            for confidence in CHECK_CONFIDENCES:
+                for limit in (1, None):
+                    full = imt.match_template(haystack, needle, confidence, limit,
+                                              coarse=False)
+                    coarse = imt.match_template(haystack, needle, confidence, limit)
+                    checked += 1
+                    if full != coarse:
+                        mismatches.append((os.path.basename(path), name, confidence, limit,
+                                           len(full), len(coarse)))
+    return checked, mismatches
+
+
+def compare(current, baseline, threshold):
+    """Print p50 changes against a baseline, return the regressed detectors"""
+    regressions = []
+    for resolution, detectors in sorted(current.items()):
+        for detector, stats in sorted(detectors.items()):
+            old = baseline.get(resolution, {}).get(detector)
+            if not old or not old["p50"]:
+                continue
+            ratio = stats["p50"] / old["p50"]
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  REGRESSION"
+                regressions.append((resolution, detector))
+            print(f"{resolution:>9} {detector:<45} {old['p50']:9.3f} -> "
+                  f"{stats['p50']:9.3f} ms  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def report(summary):
+    """Print one line per detector"""
+    for resolution, detectors in sorted(summary.items()):
+        print(f"\n{resolution}")
+        print(f"{'detector':<45} {'n':>5} {'p50':>8} {'p90':>8} {'p99':>8} "
+              f"{'max':>8} {'fps':>9} {'acc':>6}")
+        for detector, s in detectors.items():
+            acc = f"{s['accuracy']:.0%}" if "accuracy" in s else ""
+            print(f"{detector:<45} {s['n']:>5} {s['p50']:8.3f} {s['p90']:8.3f} "
+                  f"{s['p99']:8.3f} {s['max']:8.3f} {s['fps']:9.1f} {acc:>6}")
+
+
+def main():
+    """Entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", help="Folder with a subfolder per resolution")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", help="Compare with a saved baseline")
+    parser.add_argument("--save-baseline", help="Save the results as a baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="p50 slowdown that counts as a regression")
+    parser.add_argument("--check-coarse", action="store_true",
+                        help="Fail if the half-size search changes any match")
+    args = parser.parse_args()
+
+    imt.DEBUG = False
+    imt.logger.setLevel("WARNING")
+    folders = {}
+    for name in sorted(os.listdir(args.corpus)):
+        folder = os.path.join(args.corpus, name)
+        if re.fullmatch(r"\d+x\d+", name) and os.path.isdir(folder):
+            folders[name] = folder
+    if not folders:
+        parser.error(f"No <width>x<height> folders in {args.corpus}")
+    if args.check_coarse:
+        failed = False
+        for name, folder in folders.items():
+            checked, mismatches = check_coarse(folder)
+            print(f"{name}: {len(mismatches)} of {checked} coarse matches differ")
+            for frame, template, confidence, limit, full, coarse in mismatches:
+                print(f"  {frame} {template} confidence={confidence} limit={limit}: "
+                      f"{full} hits at full resolution, {coarse} with coarse")
+            failed = failed or bool(mismatches)
+        if failed:
+            raise SystemExit(1)
+        return
+    ocr_engine = ocr_engine_available()
+    summary = {name: bench_resolution(folder, args.repeat, ocr_engine)
+               for name, folder in folders.items()}
+    report(summary)
+    if not ocr_engine:
+        print("\nOCR not measured, the OCR engine needs Windows and screen_ocr")
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print()
+        if compare(summary, baseline, args.threshold):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
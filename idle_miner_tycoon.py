@@ -1,29 +1,81 @@
 """Play Idle Miner Tycoon"""
 # pip install winsdk pyautogui screen_ocr[winrt] wheel pywin32 opencv-python
 import argparse
+import functools
+import hashlib
+import heapq
+import json
 import time
 import os
 import logging
+import re
+import shutil
 import sys
-from collections import namedtuple
+import threading
+from collections import namedtuple, OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from enum import Enum
-import win32gui
-import pyautogui
-import pyscreeze
-import screen_ocr
+import numpy as np
+import cv2
+try:  # Windows only, the replay backend works without them
+    import win32gui
+    import pyautogui
+    from PIL import Image
+except ImportError:
+    win32gui = pyautogui = Image = None
 
 DEBUG = True
 LOW_RESOLUTION = (423, 726)
 HIGH_RESOLUTION = (659, 1131)
-OCR_READER = screen_ocr.Reader.create_quality_reader()
-SCALE = 1
-BLUESTACKS = None
+# Region and Loc coordinates are in LOW_RESOLUTION pixels, scaled by window width
+NATIVE_RESOLUTIONS = (LOW_RESOLUTION, HIGH_RESOLUTION)
+ASPECT_TOLERANCE = 0.02
+# Seconds to wait for the screen to start changing after input, before a settle
+# wait decides the input did nothing visible
+SETTLE_CHANGE_WAIT = 0.5
+# How much further under confidence than a needle's own loss a coarse match may
+# score and still be checked at full resolution. It's a tuning value, not a
+# bound: it was picked so the templates and the benchmark corpus match exactly
+# as they do at full resolution (benchmark.py --check-coarse), an unusual
+# needle or frame can still lose a hit to the half-size search
+COARSE_MARGIN = 0.15
+# Needles whose half-size copy keeps less of their contrast (standard deviation)
+# than this, like fine stripes or checkers, are only matched at full resolution
+COARSE_MIN_CONTRAST = 0.4
+# Needles smaller than this (pixels) skip the half-size search, and beyond this
+# many candidate windows the whole haystack is matched at full resolution
+COARSE_MIN_SIZE = 12
+COARSE_MAX_WINDOWS = 20
+# Shorter crops (pixels) are scaled up before OCR, it misreads small text
+OCR_MIN_HEIGHT = 20
 SCRIPT_DIR = os.path.dirname(__file__)
+# Templates rescaled from the native folders for other window sizes
+TEMPLATE_CACHE = os.path.join(SCRIPT_DIR, "template-cache")
+# Where templates have been found, a <w>x<h>.json per resolution
+SEARCH_REGIONS = os.path.join(SCRIPT_DIR, "search-regions")
+# What each bot has learned about its managers, a folder per bot
+MANAGER_STORE = os.path.join(SCRIPT_DIR, "managers")
+# Digit glyphs learned from OCR, a <w>x<h> folder per resolution
+DIGITS = os.path.join(SCRIPT_DIR, "digits")
+# Every template the bot looks for, checked once when the templates load
+TEMPLATE_NAMES = (
+    "assign-anyway.png", "assign-anyway2.png", "assign.png", "cancel.png",
+    "claim.png", "close-blue.png", "collect.png", "dollar-mgr-tab.png",
+    "edgar-extravaganza.png", "edgar.png", "event-mine.png", "exclamation.png",
+    "free-idle.png", "free.png", "frontier-shop.png", "frontier-shop2.png",
+    "get.png", "hire-manager-button.png", "hire-manager-button2.png",
+    "idle-miner.png", "level.png", "mainland-menu.png", "max-selected.png",
+    "max-unselected.png", "maxed-upgrades.png", "mineshaft.png", "new-shaft.png",
+    "red-x.png", "remove-barrier.png", "shop.png", "shovel.png",
+    "skip-no-time.png", "super-managers-tab-dark.png",
+    "super-managers-tab-dark2.png", "super-managers-tab.png", "unassign.png",
+    "upgrade.png", "x.png", "x2.png", "x3.png", "x4.png",
+)
 
-os.chdir(SCRIPT_DIR)
 logger = logging.getLogger(__name__)
 formatter = logging.Formatter(
-    "%(asctime)s:%(levelname)s:%(lineno)d:%(message)s", datefmt="%H:%M:%S")
+    "%(asctime)s:%(threadName)s:%(levelname)s:%(lineno)d:%(message)s", datefmt="%H:%M:%S")
 logger.setLevel(logging.DEBUG if DEBUG else logging.INFO)
 ch = logging.StreamHandler()
 ch.setFormatter(formatter)
@@ -32,55 +84,1439 @@ logger.addHandler(ch)
 Point = namedtuple("Point", ["x", "y"])
 Box = namedtuple("Box", ["x", "y", "w", "h"])
 BoundingBox = namedtuple("BoundingBox", ["left", "top", "right", "bottom"])
+# Same fields as pyscreeze.Box, so pyautogui treats it like a located image
+Match = namedtuple("Match", ["left", "top", "width", "height"])
 Window = Enum("Window", ["SHAFT", "MANAGER_CHOOSER", "LEVEL_UP", "MINE_OVERVIEW"])
 MineArea = Enum("MineArea", ["MINESHAFT", "ELEVATOR", "WAREHOUSE"])
 MineMode = Enum("MineMode", ["EVENT", "MAINLAND", "FRONTIER", "REGULAR"])
+BoostState = Enum("BoostState", ["ACTIVE", "RECOVERING", "READY", "UNKNOWN"])
+# What the Mine Overview shows: the MineArea with the exclamation mark (None
+# if there isn't one), the mark's screen Point and {MineArea: BoostState}
+OverviewSnapshot = namedtuple("OverviewSnapshot", ["needs_leveling", "exclamation", "boosts"])
+# Boost length in minutes of each super manager, by the area they work in
+SUPER_MANAGERS = {
+    MineArea.MINESHAFT: {
+        'pebble': 2, 'mrturner': 0.5, 'rangersue': 1, 'zigalvani': 1,
+        'blingsley': 1, 'chester': 5, 'goodmanjr': 5, 'gordon': 5,
+        'greenidler': 1, 'cliffwalker': 0.5, 'drsteiner': 5,
+        'rabbidblingsley': 2.5, 'sirlorenzo': 1,
+    },
+    MineArea.ELEVATOR: {
+        'queenaurora': 2.5, 'drlilly': 5, 'damianjones': 5, 'sojo': 5,
+        'mrsgoodman': 5, 'leevatori': 5, 'ezioauditore': 1,
+        'zephyria': 2.5,
+    },
+    MineArea.WAREHOUSE: {
+        'professormaple': 1, 'drnova': 5, 'luxario': 1, 'mark': 5,
+        'mrgoodman': 5, 'octaviadevere': 2.5, 'chriscapella': 5,
+        'jadekim': 5,
+    },
+}
+
+
+class Metrics:
+    """Latency histograms for the hot paths and a time budget per iteration
+
+    Every timed call lands in a histogram under its name, and its time is
+    added to its category (work, sleep, ui_wait, debug) for the current
+    iteration, minus any time spent in nested calls with their own category.
+    The categories of an iteration add up to at most its wall time.
+    """
+
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    CATEGORIES = ("work", "sleep", "ui_wait", "debug")
 
-
-def window_callback(hwnd, extra=None):
-    """Use win32gui to find the location of the bluestacks window"""
-    global BLUESTACKS, SCALE
+    def __init__(self):
+        self.histograms = {}  # name: [counts per bucket + inf, sum, count]
+        self.totals = defaultdict(float)  # category: seconds, over all iterations
+        self.iterations = 0
+        self.jsonl_path = None
+        self.prometheus_path = None
+        self._lock = threading.Lock()
+        self._local = threading.local()  # Each bot thread has its own iteration
+
+    def _thread(self):
+        """This thread's (iteration category totals, start time, stack of categories)"""
+        local = self._local
+        if not hasattr(local, "iteration"):
+            local.iteration = defaultdict(float)
+            local.start = time.perf_counter()
+            local.stack = []
+        return local
+
+    def observe(self, name, seconds):
+        """Add one latency to a histogram"""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = [[0] * (len(self.BUCKETS) + 1), 0.0, 0]
+            counts = histogram[0]
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    @contextmanager
+    def timed(self, name, category=None):
+        """Time a block into the name histogram and the iteration's category"""
+        local = self._thread()
+        start = time.perf_counter()
+        local.stack.append(category)
+        try:
+            yield
+        finally:
+            local.stack.pop()
+            elapsed = time.perf_counter() - start
+            self.observe(name, elapsed)
+            if category is not None:
+                local.iteration[category] += elapsed
+                # Only count time once, in the innermost category
+                parent = next((c for c in reversed(local.stack) if c is not None), None)
+                if parent is not None:
+                    local.iteration[parent] -= elapsed
+
+    def end_iteration(self, task=None):
+        """Close the current iteration's budget, export it and return it"""
+        local = self._thread()
+        now = time.perf_counter()
+        summary = {"time": time.time(), "thread": threading.current_thread().name,
+                   "task": task, "total": now - local.start}
+        for category in self.CATEGORIES:
+            summary[category] = local.iteration[category]
+        summary["other"] = summary["total"] - sum(local.iteration.values())
+        local.iteration.clear()
+        local.start = now
+        with self._lock:
+            for category in self.CATEGORIES + ("other",):
+                self.totals[category] += summary[category]
+            self.iterations += 1
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(summary) + "\n")
+            write_prometheus = self.prometheus_path and self.iterations % 10 == 0
+        if write_prometheus:
+            self.write_prometheus(self.prometheus_path)
+        return summary
+
+    def write_prometheus(self, path):
+        """Write everything in the Prometheus text format, replacing path"""
+        lines = [
+            "# TYPE imt_latency_seconds histogram",
+        ]
+        with self._lock:
+            histograms = {
+                name: (list(counts), total, count)
+                for name, (counts, total, count) in self.histograms.items()
+            }
+        for name, (counts, total, count) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.BUCKETS + ("+Inf",), counts):
+                cumulative += bucket
+                lines.append(
+                    f'imt_latency_seconds_bucket{{op="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'imt_latency_seconds_sum{{op="{name}"}} {total}')
+            lines.append(f'imt_latency_seconds_count{{op="{name}"}} {count}')
+        lines.append("# TYPE imt_time_seconds_total counter")
+        for category, seconds in sorted(self.totals.items()):
+            lines.append(f'imt_time_seconds_total{{category="{category}"}} {seconds}')
+        lines.append("# TYPE imt_iterations_total counter")
+        lines.append(f"imt_iterations_total {self.iterations}")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".tmp", path)
+
+
+METRICS = Metrics()
+
+
+def instrumented(name, category="work"):
+    """Decorator to time every call of a function with METRICS"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with METRICS.timed(name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def startup_phase(name):
+    """Time and log one step of getting ready to play"""
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    METRICS.observe("startup:" + name, elapsed)
+    logger.info("Startup: %s took %.2fs", name, elapsed)
+
+
+class Templates:
+    """Template images for one resolution, decoded on first use and kept in memory"""
+
+    _loaded = {}  # folder: Templates, shared by every bot
+    _loaded_lock = threading.Lock()
+
+    def __init__(self, folder=None):
+        self.folder = folder
+        self._images = None  # Until loaded
+        self._missing = set()
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        """Load the folder the first time a template is needed"""
+        if self._images is None:
+            with self._lock:
+                if self._images is None:
+                    self.load(self.folder)
+        return self._images
+
+    def load(self, folder, required=TEMPLATE_NAMES):
+        """Decode every PNG in folder and report required templates that are missing"""
+        with startup_phase("templates"):
+            self._load(folder, required)
+
+    def _load(self, folder, required):
+        self.folder = folder
+        images = {}
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(".png"):
+                continue
+            image = cv2.imread(os.path.join(folder, name), cv2.IMREAD_COLOR)
+            if image is None:
+                logger.error("Couldn't decode %s", name)
+                continue
+            images[name] = image
+        self._missing = {name for name in required if name not in images}
+        for name in sorted(self._missing):
+            logger.error("%s does not exist in %s", name, folder)
+        logger.info("Loaded %d templates from %s", len(images), folder)
+        self._images = images
+
+    def get(self, name):
+        """Return the BGR array for a template, or None if it doesn't exist"""
+        image = self._ensure_loaded().get(name)
+        if image is None and name not in self._missing:
+            logger.error("%s does not exist in %s", name, self.folder)
+            self._missing.add(name)
+        return image
+
+    def __contains__(self, name):
+        return name in self._ensure_loaded()
+
+    @classmethod
+    def for_folder(cls, folder):
+        """Templates for folder, shared by every bot and loaded when first used"""
+        with cls._loaded_lock:
+            if folder not in cls._loaded:
+                cls._loaded[folder] = cls(folder)
+            return cls._loaded[folder]
+
+
+class CoarseNeedles:
+    """Half-size needles and how much they lose to the half-size grid (LRU)
+
+    A half-size frame only samples every other pixel, so a needle that sits
+    between samples scores lower than it would at full resolution. The loss
+    is measured once per needle by shifting it by a pixel against itself.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self._needles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, needle):
+        """(half-size needle, score a hit may lose) for a BGR needle
+
+        The half-size needle is None if it keeps too little of the needle to
+        search with.
+        """
+        key = (needle.shape, hash(needle.tobytes()))
+        with self._lock:
+            found = self._needles.get(key)
+            if found is not None:
+                self._needles.move_to_end(key)
+                return found
+        small = shrink(needle)
+        loss = 0.0
+        if small.std() < COARSE_MIN_CONTRAST * needle.std():
+            small = None
+        else:
+            padded = cv2.copyMakeBorder(needle, 4, 4, 4, 4, cv2.BORDER_REPLICATE)
+            loss = max(
+                1 - cv2.matchTemplate(cv2.pyrDown(padded[dy:, dx:]), small,
+                                      cv2.TM_CCOEFF_NORMED).max()
+                for dy in (0, 1) for dx in (0, 1))
+        with self._lock:
+            self._needles[key] = (small, float(loss))
+            while len(self._needles) > self.size:
+                self._needles.popitem(last=False)
+        return small, float(loss)
+
+
+COARSE_NEEDLES = CoarseNeedles()
+
+
+def shrink(needle):
+    """Half-size needle without the border pyrDown has to make up"""
+    return cv2.pyrDown(needle)[1:-1, 1:-1]
+
+
+def match_template(haystack, needle, confidence, limit=None, coarse=True, small=None):
+    """Find needle in haystack the way pyscreeze does, Matches are relative to haystack
+
+    With coarse, a half-size search rejects most misses and only the
+    positions it can't rule out are scored at full resolution. small is
+    pyrDown(haystack), for callers searching one haystack for many needles.
+    """
+    h, w = needle.shape[:2]
+    if haystack.shape[0] < h or haystack.shape[1] < w:
+        return []
+    if coarse and min(h, w) >= COARSE_MIN_SIZE:
+        result = coarse_to_fine(haystack, needle, confidence, small)
+        if result is None:
+            return []  # Most lookups are misses
+    else:
+        result = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+    if limit == 1 and result.max() <= confidence:
+        return []
+    ys, xs = np.nonzero(result > confidence)
+    if limit:
+        ys, xs = ys[:limit], xs[:limit]
+    return [Match(int(x), int(y), w, h) for y, x in zip(ys, xs)]
+
+
+def coarse_to_fine(haystack, needle, confidence, small_haystack=None):
+    """Full resolution scores near coarse candidates (-1 elsewhere), None if there are none
+
+    A needle with its top left at y, x shows up around coarse (y + 2) // 2,
+    (x + 2) // 2, scoring up to its loss from CoarseNeedles lower than at full
+    resolution. Each coarse candidate is checked at the positions it stands for.
+    """
+    h, w = needle.shape[:2]
+    small, loss = COARSE_NEEDLES.get(needle)
+    if small is None:
+        return cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+    if small_haystack is None:
+        small_haystack = cv2.pyrDown(haystack)
+    coarse = cv2.matchTemplate(small_haystack, small, cv2.TM_CCOEFF_NORMED)
+    candidates = (coarse > confidence - loss - COARSE_MARGIN).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(candidates)
+    if count == 1:
+        return None
+    if count > COARSE_MAX_WINDOWS:
+        return cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+    rows, cols = haystack.shape[0] - h + 1, haystack.shape[1] - w + 1
+    scores = np.full((rows, cols), -1, dtype=np.float32)
+    for x, y, width, height, _ in stats[1:]:
+        top, left = max(2 * y - 4, 0), max(2 * x - 4, 0)
+        bottom, right = min(2 * (y + height - 1), rows - 1), min(2 * (x + width - 1), cols - 1)
+        if top > bottom or left > right:
+            continue
+        window = haystack[top:bottom + h, left:right + w]
+        scores[top:bottom + 1, left:right + 1] = cv2.matchTemplate(
+            window, needle, cv2.TM_CCOEFF_NORMED)
+    return scores
+
+
+def distinct(matches):
+    """Drop Matches that overlap an earlier one by more than half their size"""
+    kept = []
+    for m in matches:
+        if all(abs(m.left - k.left) > m.width // 2 or abs(m.top - k.top) > m.height // 2
+               for k in kept):
+            kept.append(m)
+    return kept
+
+
+def center(match):
+    """Center Point of a Match"""
+    return Point(match.left + match.width // 2, match.top + match.height // 2)
+
+
+def window_callback(hwnd, extra):
+    """Use win32gui to collect the bluestacks windows into the extra list"""
     title = win32gui.GetWindowText(hwnd)
     if "bluestacks app player" not in title.lower():
         return
-    left, top, right, bottom = win32gui.GetWindowRect(hwnd)
-    w, h = right - left, bottom - top
-    if BLUESTACKS == (left, top, w, h):
-        return  # Nothing changed
-    logger.info("'%s', Loc: (%d, %d), Size: (%d, %d)", title, left, top, w, h)
-    if (w, h) not in (HIGH_RESOLUTION, LOW_RESOLUTION):
-        logger.error("Resolution not found: (%d, %d)", w, h)
-        w, h = HIGH_RESOLUTION
-    win32gui.MoveWindow(hwnd, 0, 0, w, h, True)
-    if (w, h) == HIGH_RESOLUTION:
-        logger.info("Changing to high-resolution mode")
-        os.chdir(os.path.join(SCRIPT_DIR, f"{w}x{h}"))
-        SCALE = 1.557851
-    elif (w, h) == LOW_RESOLUTION:
-        logger.info("Changing to low-resolution mode")
-        os.chdir(os.path.join(SCRIPT_DIR, f"{w}x{h}"))
-    else:
-        logger.error("Bad resolution")
+    extra.append((hwnd, title, win32gui.GetWindowRect(hwnd)))
+
+
+def find_windows():
+    """[(hwnd, title, rect)] of every bluestacks window"""
+    windows = []
+    win32gui.EnumWindows(window_callback, windows)
+    return windows
+
+
+def pixel_hash(pixels):
+    """Hash of an image array that's the same in every process"""
+    digest = hashlib.blake2b(np.ascontiguousarray(pixels).tobytes(), digest_size=16)
+    return "%s:%s" % ("x".join(map(str, pixels.shape)), digest.hexdigest())
+
+
+class Backend:
+    """Where frames come from and where input goes"""
+
+    def find_window(self):
+        """Return the Box of the game window, or None"""
+        raise NotImplementedError
+
+    def screenshot(self, box):
+        """Capture a screen Box as a BGR array"""
+        raise NotImplementedError
+
+    def pixel(self, x, y):
+        """RGB color of one screen pixel"""
+        raise NotImplementedError
+
+    def ocr(self, pixels):
+        """Read the text in a BGR array"""
+        raise NotImplementedError
+
+    def click(self, *args, **kwargs):
+        """Click, takes the same arguments as pyautogui.click"""
+        raise NotImplementedError
+
+    def press(self, keys):
+        """Press keys, takes the same arguments as pyautogui.press"""
+        raise NotImplementedError
+
+    def drag_rel(self, *args, **kwargs):
+        """Drag, takes the same arguments as pyautogui.dragRel"""
+        raise NotImplementedError
+
+    def move_to(self, *args, **kwargs):
+        """Move the mouse, takes the same arguments as pyautogui.moveTo"""
+        raise NotImplementedError
+
+    def focus(self):
+        """Bring the window to the front so key presses go to it"""
+
+    def clock(self):
+        """Seconds, only differences matter"""
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        """Wait on this backend's clock"""
+        time.sleep(seconds)
+
+
+class WindowsBackend(Backend):
+    """A live Bluestacks window, through win32gui, pyautogui and screen_ocr
+
+    Bound to one window handle (the first bluestacks window if None), which
+    is moved to position. Every instance shares one OCR engine, created the
+    first time something is read.
+    """
+
+    _ocr_reader = None
+    _ocr_lock = threading.Lock()
+
+    def __init__(self, hwnd=None, position=(0, 0), width=None):
+        if win32gui is None:
+            raise RuntimeError("WindowsBackend needs pywin32 and pyautogui")
+        self.hwnd = hwnd
+        self.position = position
+        self.width = width  # Resize the window to this width, None keeps it
+
+    @classmethod
+    def _reader(cls):
+        """The shared OCR engine, winrt is slow to import so it waits until needed"""
+        with cls._ocr_lock:
+            if cls._ocr_reader is None:
+                with startup_phase("ocr_engine"):
+                    import screen_ocr  # pylint: disable=import-outside-toplevel
+                    cls._ocr_reader = screen_ocr.Reader.create_quality_reader()
+            return cls._ocr_reader
+
+    def find_window(self):
+        if self.hwnd is None:
+            windows = find_windows()
+            if not windows:
+                return None
+            self.hwnd = windows[0][0]
+        title = win32gui.GetWindowText(self.hwnd)
+        left, top, right, bottom = win32gui.GetWindowRect(self.hwnd)
+        w, h = right - left, bottom - top
+        logger.info("'%s', Loc: (%d, %d), Size: (%d, %d)", title, left, top, w, h)
+        fitted = fit_resolution(self.width or w)
+        if (w, h) != fitted:
+            logger.info("Resizing to (%d, %d)", *fitted)
+            w, h = fitted
+        x, y = self.position
+        win32gui.MoveWindow(self.hwnd, x, y, w, h, True)
+        return Box(x, y, w, h)
+
+    def screenshot(self, box):
+        img = pyautogui.screenshot(region=(box.x, box.y, box.w, box.h))
+        return cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+
+    def pixel(self, x, y):
+        return pyautogui.pixel(x, y)
+
+    def ocr(self, pixels):
+        return self.read_text(pixels)
+
+    @classmethod
+    def read_text(cls, pixels):
+        """OCR a BGR array with the engine, works on saved images without a window"""
+        image = Image.fromarray(np.ascontiguousarray(pixels[:, :, ::-1]))
+        reader = cls._reader()
+        with cls._ocr_lock:
+            return reader.read_image(image).as_string()
+
+    def click(self, *args, **kwargs):
+        pyautogui.click(*args, **kwargs)
+
+    def press(self, keys):
+        pyautogui.press(keys)
+
+    def drag_rel(self, *args, **kwargs):
+        pyautogui.dragRel(*args, **kwargs)
+
+    def move_to(self, *args, **kwargs):
+        pyautogui.moveTo(*args, **kwargs)
+
+    def focus(self):
+        try:
+            win32gui.SetForegroundWindow(self.hwnd)
+        except win32gui.error as error:  # pywintypes.error, Windows can refuse
+            # Clicking the title bar focuses the window without touching the game
+            logger.warning("Couldn't bring the window to the front (%s), clicking it", error)
+            left, top, right, _ = win32gui.GetWindowRect(self.hwnd)
+            pyautogui.click((left + right) // 2, top + 10)
+
+
+class RecordingBackend(Backend):
+    """Pass everything to another backend, saving frames, OCR and input for replay
+
+    Each input is saved to inputs.jsonl with the number of the first frame
+    captured after it, which is where a replay of that input picks up.
+    """
+
+    def __init__(self, backend, folder):
+        self.backend = backend
+        self.folder = folder
+        self.frames = 0
+        self.ocr_results = {}
+        self._lock = threading.Lock()  # A capture thread may record frames too
+        os.makedirs(folder, exist_ok=True)
+        open(os.path.join(folder, "inputs.jsonl"), "w", encoding="utf-8").close()
+
+    def _record_input(self, action):
+        """Save an input and the frame the replay should show after it"""
+        with self._lock:
+            line = json.dumps({"action": action, "frame": self.frames})
+            with open(os.path.join(self.folder, "inputs.jsonl"), "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def find_window(self):
+        return self.backend.find_window()
+
+    def screenshot(self, box):
+        frame = self.backend.screenshot(box)
+        with self._lock:
+            cv2.imwrite(os.path.join(self.folder, "frame-%06d.png" % self.frames), frame)
+            self.frames += 1
+        return frame
+
+    def pixel(self, x, y):
+        return self.backend.pixel(x, y)
+
+    def ocr(self, pixels):
+        text = self.backend.ocr(pixels)
+        self.ocr_results[pixel_hash(pixels)] = text
+        with open(os.path.join(self.folder, "ocr.json"), "w", encoding="utf-8") as f:
+            json.dump(self.ocr_results, f, indent=1)
+        return text
+
+    def click(self, *args, **kwargs):
+        self.backend.click(*args, **kwargs)
+        self._record_input("click")
+
+    def press(self, keys):
+        self.backend.press(keys)
+        self._record_input("press")
+
+    def drag_rel(self, *args, **kwargs):
+        self.backend.drag_rel(*args, **kwargs)
+        self._record_input("drag_rel")
+
+    def move_to(self, *args, **kwargs):
+        self.backend.move_to(*args, **kwargs)
+
+    def focus(self):
+        self.backend.focus()
+
+
+class ReplayFinished(Exception):
+    """A ReplayBackend ran out of frames"""
+
+
+class ReplayBackend(Backend):
+    """Serve recorded frames and log input instead of sending it
+
+    Frames are the PNGs in folder in name order. With advance="input" and
+    the folder's inputs.jsonl, each input jumps to the first frame recorded
+    after it and captures step through the frames recorded until the next
+    input, so the bot sees what it saw live. Without inputs.jsonl the next
+    frame is served after every input. advance="capture" serves the next
+    frame after every capture and advance="none" only moves on seek().
+    OCR answers come from the folder's ocr.json (pixel_hash: text) as
+    written by RecordingBackend. Time is simulated, so sleeps cost nothing.
+    """
+
+    def __init__(self, folder, advance="input", frame_time=1 / 30):
+        self.folder = folder
+        self.advance = advance
+        self.frame_time = frame_time  # Simulated seconds per capture
+        self.paths = sorted(
+            os.path.join(folder, name) for name in os.listdir(folder)
+            if name.lower().endswith(".png"))
+        if not self.paths:
+            raise FileNotFoundError(f"No frames in {folder}")
+        self.index = 0
+        self.events = []  # (clock, action, args)
+        self.ocr_results = {}
+        ocr_path = os.path.join(folder, "ocr.json")
+        if os.path.exists(ocr_path):
+            with open(ocr_path, encoding="utf-8") as f:
+                self.ocr_results = json.load(f)
+        self.inputs = []  # {"action", "frame"} as recorded, in order
+        inputs_path = os.path.join(folder, "inputs.jsonl")
+        if os.path.exists(inputs_path):
+            with open(inputs_path, encoding="utf-8") as f:
+                self.inputs = [json.loads(line) for line in f if line.strip()]
+        self._clock = 0.0
+        self._frame = cv2.imread(self.paths[0], cv2.IMREAD_COLOR)
+
+    def _next_frame(self):
+        """Move on to the next recorded frame"""
+        if self.index + 1 >= len(self.paths):
+            raise ReplayFinished(f"Replayed {len(self.paths)} frames")
+        self.seek(self.index + 1)
+
+    def seek(self, index):
+        """Serve frame number index next"""
+        self.index = index
+        self._frame = cv2.imread(self.paths[index], cv2.IMREAD_COLOR)
+
+    def _input(self, action, *args):
+        """Log an input event and show the frame that followed it"""
+        self.events.append((self._clock, action, args))
+        logger.debug("Replay %s %s", action, args)
+        if self.advance != "input":
+            return
+        if not self.inputs:
+            self._next_frame()
+            return
+        count = len(self.events)
+        if count > len(self.inputs) or self.inputs[count - 1]["frame"] >= len(self.paths):
+            raise ReplayFinished(f"Replayed {len(self.inputs)} inputs")
+        recorded = self.inputs[count - 1]
+        if recorded["action"] != action:
+            logger.warning("Replay input %d is a %s, recorded a %s",
+                           count, action, recorded["action"])
+        self.seek(recorded["frame"])
+
+    def _next_input_frame(self):
+        """First frame recorded after the next input, where captures stop stepping"""
+        count = len(self.events)
+        return self.inputs[count]["frame"] if count < len(self.inputs) else len(self.paths)
+
+    def find_window(self):
+        h, w = self._frame.shape[:2]
+        return Box(0, 0, w, h)
+
+    def screenshot(self, box):
+        frame = self._frame
+        self._clock += self.frame_time
+        if self.advance == "capture":
+            self._next_frame()
+        elif self.advance == "input" and self.inputs:
+            if self.index + 1 < self._next_input_frame():
+                self.seek(self.index + 1)
+        return frame[box.y:box.y + box.h, box.x:box.x + box.w].copy()
+
+    def pixel(self, x, y):
+        b, g, r = self._frame[y, x]
+        return int(r), int(g), int(b)
+
+    def ocr(self, pixels):
+        return self.ocr_results.get(pixel_hash(pixels), "")
+
+    def click(self, *args, **kwargs):
+        self._input("click", *args)
+
+    def press(self, keys):
+        self._input("press", keys)
+
+    def drag_rel(self, *args, **kwargs):
+        self._input("drag_rel", *args, kwargs)
+
+    def move_to(self, *args, **kwargs):
+        pass
+
+    def clock(self):
+        return self._clock
+
+    def sleep(self, seconds):
+        self._clock += seconds
+
+
+# There's one mouse and keyboard, bots take turns using them
+INPUT_LOCK = threading.RLock()
+
+
+class Screen:
+    """One Bluestacks window: its backend, position, scale, templates and frame
+
+    One frame is grabbed and reused by every lookup until input is sent to
+    the game (click, keypress, drag) or the frame is older than max_age.
+    With a grabber running, frames come from its buffer instead of being
+    captured on demand.
+    """
+
+    def __init__(self, backend, box, scale, templates, max_age=0.5):
+        self.backend = backend
+        self.box = box
+        self.scale = scale
+        self.templates = templates
+        self.max_age = max_age
+        self.captures = 0
+        self.transitions = {}  # label: [count, total, longest, timeouts]
+        self.grabber = None
+        self.input_time = float("-inf")  # Frames from before this are out of date
+        self.frame_time = 0
+        self._frame = None
+        self._frame_box = None
+        self._last_frame = None  # (frame, Box), kept when the frame is invalidated
+        self._before_input = None  # _last_frame when input was last sent
+        self.change_onsets = {}  # settle label: longest seconds before the screen changed
+        self._lock = threading.RLock()  # Detection workers share the frame
+        # Held by a thread that needs the window to itself, input from others waits
+        self.hold = threading.RLock()
+
+    def invalidate(self):
+        """Drop the current frame, the next lookup will capture a new one"""
+        with self._lock:
+            self._frame = None
+            self.input_time = self.backend.clock()
+
+    def _input_sent(self):
+        """Invalidate the frame, remembering it as the screen from before the input"""
+        with self._lock:
+            self._before_input = self._last_frame
+        self.invalidate()
+
+    def frame(self):
+        """Return the current frame (BGR array) and its Box on the screen"""
+        with self._lock:
+            now = self.backend.clock()
+            if self._frame is None or now - self.frame_time > self.max_age:
+                grabbed = self.grabber.latest(self.input_time) if self.grabber else None
+                if grabbed:
+                    self.frame_time, self._frame = grabbed
+                else:
+                    with METRICS.timed("capture", "work"):
+                        self._frame = self.backend.screenshot(self.box)
+                    self.frame_time = now
+                    self.captures += 1
+                self._frame_box = self.box
+                self._last_frame = self._frame, self._frame_box
+            return self._frame, self._frame_box
+
+    @staticmethod
+    def _cut(frame, fbox, box):
+        """The part of a frame at screen Box fbox inside box, and its top left Point"""
+        left = min(max(box.x - fbox.x, 0), fbox.w)
+        top = min(max(box.y - fbox.y, 0), fbox.h)
+        right = min(max(box.x + box.w - fbox.x, left), fbox.w)
+        bottom = min(max(box.y + box.h - fbox.y, top), fbox.h)
+        return frame[top:bottom, left:right], Point(fbox.x + left, fbox.y + top)
+
+    def crop(self, box, frame=None):
+        """Return the part of the frame inside a screen Box and its top left Point
+
+        frame is a (pixels, Box) pair to cut from instead of the shared frame.
+        """
+        frame, fbox = frame or self.frame()
+        return self._cut(frame, fbox, box)
+
+    def grab(self, box, since=float("-inf")):
+        """Fresh pixels inside a screen Box and their top left Point
+
+        Unlike crop this doesn't touch the shared frame, it uses the newest
+        frame in the grabber's buffer (captured after since) or else captures
+        only the box.
+        """
+        grabber = self.grabber
+        grabbed = grabber.latest(since) if grabber else None
+        if grabbed is None:
+            return self.backend.screenshot(box), Point(box.x, box.y)
+        return self._cut(grabbed[1], self.box, box)
+
+    def pixel(self, x, y):
+        """Get the RGB color of a screen pixel from the frame"""
+        return tuple(int(c) for c in self.sample([(x, y)])[0])
+
+    def sample(self, points):
+        """Get the RGB colors of many screen pixels from the frame as an Nx3 array"""
+        frame, fbox = self.frame()
+        points = np.asarray(points, dtype=int).reshape(-1, 2)
+        xs = points[:, 0] - fbox.x
+        ys = points[:, 1] - fbox.y
+        inside = (xs >= 0) & (xs < fbox.w) & (ys >= 0) & (ys < fbox.h)
+        colors = np.empty((len(points), 3), dtype=np.uint8)
+        colors[inside] = frame[ys[inside], xs[inside], ::-1]
+        for i in np.flatnonzero(~inside):
+            colors[i] = self.backend.pixel(int(points[i, 0]), int(points[i, 1]))
+        return colors
+
+    @instrumented("input", "work")
+    def click(self, *args, **kwargs):
+        """Click and invalidate the frame"""
+        with self.hold, INPUT_LOCK:
+            self.backend.click(*args, **kwargs)
+        self._input_sent()
+
+    @instrumented("input", "work")
+    def press(self, keys):
+        """Press keys in this window and invalidate the frame"""
+        with self.hold, INPUT_LOCK:  # Another bot's click may have focused its window
+            self.backend.focus()
+            self.backend.press(keys)
+        self._input_sent()
+
+    @instrumented("input", "work")
+    def drag(self, start, offset, duration=2, pause=0.5):
+        """Drag from start by an (x, y) offset and invalidate the frame
+
+        The whole move, pause and drag is one turn on the mouse, so another
+        bot can't move it in between.
+        """
+        with self.hold, INPUT_LOCK:
+            self.backend.move_to(start)
+            self.backend.sleep(pause)
+            self.backend.drag_rel(xOffset=offset[0], yOffset=offset[1], duration=duration)
+        self._input_sent()
+
+    def move_to(self, *args, **kwargs):
+        """Move the mouse, the game doesn't react so the frame is kept"""
+        with INPUT_LOCK:
+            self.backend.move_to(*args, **kwargs)
+
+    @staticmethod
+    def _thumbnail(pixels):
+        """1/4 scale gray copy of a BGR array, to compare frames cheaply"""
+        gray = cv2.cvtColor(pixels, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, None, fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def _differ(a, b, tolerance):
+        """True if two thumbnails differ by more than tolerance (mean absolute difference)"""
+        return a.shape != b.shape or cv2.absdiff(a, b).mean() > tolerance
+
+    @instrumented("wait_until_stable", "ui_wait")
+    def wait_until_stable(self, box, max_wait, min_wait=0.1, tolerance=2.0,
+                          settle=2, interval=0.05, label=None):
+        """Wait until the pixels in a screen Box stop changing, return seconds waited
+
+        First waits for the Box to differ from the frame before the last
+        input, so an animation that hasn't started yet isn't taken for a
+        settled screen. If it doesn't change within the label's change wait
+        (SETTLE_CHANGE_WAIT, or longer if the label has been slower to start
+        before), the input is assumed to have done nothing visible. Then
+        returns once `settle` frames in a row differ from the one before by at
+        most `tolerance` (mean absolute difference of a 1/4 scale gray copy).
+        max_wait bounds the whole wait. The time taken is recorded under label.
+        """
+        start = self.backend.clock()
+        self.backend.sleep(min(min_wait, max_wait))
+        with self._lock:
+            before = self._before_input
+        if before is not None:
+            before = self._thumbnail(self._cut(before[0], before[1], box)[0])
+        change_wait = max(SETTLE_CHANGE_WAIT, 1.5 * self.change_onsets.get(label, 0))
+        changed = before is None
+        previous = None
+        still = 0
+        while True:
+            self.invalidate()
+            pixels, _ = self.crop(box)
+            small = self._thumbnail(pixels)
+            elapsed = self.backend.clock() - start
+            if not changed:
+                changed = self._differ(small, before, tolerance)
+                if changed and label is not None:
+                    self.change_onsets[label] = max(self.change_onsets.get(label, 0), elapsed)
+                changed = changed or elapsed >= change_wait
+            if changed:
+                if previous is not None and not self._differ(small, previous, tolerance):
+                    still += 1
+                else:
+                    still = 0
+                previous = small
+            if still >= settle or elapsed >= max_wait:
+                break
+            self.backend.sleep(interval)
+        if label is not None:
+            record = self.transitions.setdefault(label, [0, 0.0, 0.0, 0])
+            record[0] += 1  # count
+            record[1] += elapsed  # total
+            record[2] = max(record[2], elapsed)  # longest
+            record[3] += still < settle  # timed out
+        logger.debug("Settled %s in %.2fs", label, elapsed)
+        return elapsed
+
+    def transition_stats(self):
+        """{label: (count, mean seconds, max seconds, timeouts)} of settle waits"""
+        return {
+            label: (count, total / count, longest, timeouts)
+            for label, (count, total, longest, timeouts) in self.transitions.items()
+        }
+
+
+class FrameGrabber:
+    """Capture thread that keeps the newest frames of a window in a bounded buffer"""
+
+    def __init__(self, screen, interval=0.1, size=2):
+        self.screen = screen
+        self.interval = interval
+        self.frames = deque(maxlen=size)  # (capture start time, BGR array)
+        self.listeners = []  # Called with no arguments after every capture
+        self._ready = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start capturing in the background"""
+        self._stop.clear()
+        name = f"{threading.current_thread().name}-capture"
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop capturing and wait for the thread to finish"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        backend = self.screen.backend
+        while not self._stop.is_set():
+            start = backend.clock()
+            with METRICS.timed("capture", "work"):
+                frame = backend.screenshot(self.screen.box)
+            with self._ready:
+                self.frames.append((start, frame))
+                self.screen.captures += 1
+                self._ready.notify_all()
+            for listener in self.listeners:
+                listener()
+            self._stop.wait(max(0.0, self.interval - (backend.clock() - start)))
+
+    def latest(self, since, timeout=1.0):
+        """(time, frame) of the newest frame captured after since, None on timeout"""
+        with METRICS.timed("wait_frame", "ui_wait"), self._ready:
+            if self._ready.wait_for(
+                    lambda: self.frames and self.frames[-1][0] >= since, timeout):
+                return self.frames[-1]
+        return None
+
+
+class Pipeline:
+    """A capture thread and a pool of detection workers for one bot
+
+    Watched detections run on the workers against each new frame, one at a
+    time per watch. A lookup reads the newest result if its frame is younger
+    than max_age and no input was sent since it was captured. A full frame
+    sweep takes longer than the Screen's max_age, so this one is looser.
+    """
+
+    def __init__(self, screen, capture_interval=0.1, buffer=2, workers=2, max_age=2.0):
+        self.screen = screen
+        self.max_age = max_age
+        self.grabber = FrameGrabber(screen, capture_interval, buffer)
+        self.grabber.listeners.append(self._detect_all)
+        self.pool = ThreadPoolExecutor(
+            workers, thread_name_prefix=f"{threading.current_thread().name}-detect")
+        self._watches = {}  # key: function run on the current frame
+        self._results = {}  # key: (frame time, result)
+        self._busy = set()  # Keys being detected
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start capturing, and feed frames to the Screen from the buffer"""
+        self.screen.grabber = self.grabber
+        self.grabber.start()
+
+    def stop(self):
+        """Stop capturing and detecting, the Screen captures on demand again"""
+        self.screen.grabber = None
+        self.grabber.stop()
+        self.pool.shutdown(wait=True)
+
+    def watch(self, key, func):
+        """Run func(frame=(pixels, Box)) on every new frame, result(key) reads its value"""
+        self._watches[key] = func
+
+    def result(self, key):
+        """The newest result for a watch, None if there isn't an up to date one"""
+        with self._lock:
+            ready = self._results.get(key)
+        if ready is None:
+            return None
+        frame_time, value = ready
+        now = self.screen.backend.clock()
+        if frame_time < self.screen.input_time or now - frame_time > self.max_age:
+            return None
+        return value
+
+    def _detect_all(self):
+        """Hand every idle watch to the workers"""
+        for key, func in list(self._watches.items()):
+            with self._lock:
+                if key in self._busy:
+                    continue
+                self._busy.add(key)
+            self.pool.submit(self._detect, key, func)
+
+    def _detect(self, key, func):
+        """Worker body for one watch, run on the newest captured frame"""
+        use_screen(self.screen)
+        try:
+            with METRICS.timed("detect:" + str(key[0]), "work"):
+                frame_time, pixels = self.grabber.frames[-1]
+                value = func(frame=(pixels, self.screen.box))
+            with self._lock:
+                self._results[key] = (frame_time, value)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Detection %s failed", key)
+        finally:
+            with self._lock:
+                self._busy.discard(key)
+
+
+class EdgarWatcher:
+    """Thread that clicks Edgar the moment he shows up in a bot's Edgar region
+
+    The small region is checked a few times a second, from the capture
+    buffer when the pipeline is running. From the click on Edgar until his
+    reward is claimed the watcher holds the screen, so the bot's own input
+    waits instead of landing in Edgar's dialog.
+    """
+
+    IMAGES = ("edgar.png", "edgar-extravaganza.png")
+
+    def __init__(self, bot, interval=0.5, overdue_interval=60):
+        self.bot = bot
+        self.interval = interval
+        self.overdue_interval = overdue_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start watching in the background"""
+        self._stop.clear()
+        name = f"{threading.current_thread().name}-edgar"
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching and wait for the thread to finish"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        use_screen(self.bot.screen)
+        last_overdue_check = clock()
+        while not self._stop.wait(self.interval):
+            try:
+                with METRICS.timed("edgar_watch", "work"):
+                    self.check()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Edgar watcher failed")
+            if clock() - last_overdue_check > self.overdue_interval:
+                self.bot.check_edgar_overdue()
+                last_overdue_check = clock()
+
+    def check(self):
+        """Click Edgar and claim the reward if he's showing, True if he was"""
+        screen = self.bot.screen
+        pixels, origin = screen.grab(self.bot.region_edgar.box())
+        for image in self.IMAGES:
+            needle = screen.templates.get(image)
+            if needle is None:
+                continue
+            matches = match_template(pixels, needle, self.bot.confidence, limit=1)
+            if matches:
+                loc = center(matches[0])
+                with screen.hold:
+                    screen.click(Point(origin.x + loc.x, origin.y + loc.y))
+                    logger.info("Clicked %s", image)
+                    self.claim()
+                return True
+        return False
+
+    def claim(self, timeout=5):
+        """Click the free button in Edgar's dialog and wait for it to close
+
+        Only frames captured after the last click are looked at, and the
+        shared frame is invalidated once at the end rather than while waiting.
+        """
+        bot = self.bot
+        screen = bot.screen
+        bot.last_edgar_time = clock()
+        free = self._wait_for("free.png", True, timeout)
+        if free:
+            screen.click(free)
+            logger.info("Found edgar")
+            self._wait_for("free.png", False, timeout)
+        screen.invalidate()
+
+    def _wait_for(self, image, present, timeout):
+        """Screen Point of image once it's showing (or None once it's gone if not present)"""
+        screen = self.bot.screen
+        needle = screen.templates.get(image)
+        end_time = clock() + timeout
+        while needle is not None and clock() < end_time and not self._stop.is_set():
+            pixels, origin = screen.grab(self.bot.region_game.box(), since=screen.input_time)
+            matches = match_template(pixels, needle, self.bot.confidence, limit=1)
+            if bool(matches) == present:
+                if not matches:
+                    return None
+                loc = center(matches[0])
+                return Point(origin.x + loc.x, origin.y + loc.y)
+            sleep(0.25)
+        return None
+
+
+def fit_resolution(width):
+    """Window size with the game's aspect ratio for a width"""
+    w, h = LOW_RESOLUTION
+    return width, round(width * h / w)
+
+
+def resolution_scale(width):
+    """Factor from LOW_RESOLUTION coordinates to a window this wide"""
+    return width / LOW_RESOLUTION[0]
+
+
+def template_folder(w, h):
+    """Folder with templates for a w x h window, rescaled and cached if not native"""
+    if (w, h) in NATIVE_RESOLUTIONS:
+        return os.path.join(SCRIPT_DIR, f"{w}x{h}")
+    folder = os.path.join(TEMPLATE_CACHE, f"{w}x{h}")
+    sources = [os.path.join(SCRIPT_DIR, f"{sw}x{sh}") for sw, sh in NATIVE_RESOLUTIONS]
+    newest = max(os.path.getmtime(os.path.join(source, name))
+                 for source in sources for name in os.listdir(source))
+    if not os.path.isdir(folder) or os.path.getmtime(folder) < newest:
+        with startup_phase("scale_templates"):
+            build_templates(folder, w)
+    return folder
+
+
+def build_templates(folder, width):
+    """Rescale the native templates into folder for a window this wide
+
+    Each template is shrunk from the smallest native set at least as wide,
+    or grown from the widest when the window is bigger than both. A template
+    only one set has comes from that set.
+    """
+    natives = sorted(NATIVE_RESOLUTIONS, key=lambda res: (res[0] < width, abs(res[0] - width)))
+    names = set()
+    for w, h in natives:
+        names.update(name for name in os.listdir(os.path.join(SCRIPT_DIR, f"{w}x{h}"))
+                     if name.lower().endswith(".png"))
+    staging = f"{folder}.{os.getpid()}.tmp"
+    os.makedirs(staging, exist_ok=True)
+    for name in sorted(names):
+        for w, h in natives:
+            path = os.path.join(SCRIPT_DIR, f"{w}x{h}", name)
+            if os.path.exists(path):
+                break
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            logger.error("Couldn't decode %s", path)
+            continue
+        factor = width / w
+        size = (max(1, round(image.shape[1] * factor)), max(1, round(image.shape[0] * factor)))
+        interpolation = cv2.INTER_AREA if factor < 1 else cv2.INTER_CUBIC
+        image = cv2.resize(image, size, interpolation=interpolation)
+        cv2.imwrite(os.path.join(staging, name), image)
+    # Swap the whole folder in so a half-built cache is never loaded
+    shutil.rmtree(folder, ignore_errors=True)
+    try:
+        os.replace(staging, folder)
+    except OSError:  # Another bot finished first
+        shutil.rmtree(staging, ignore_errors=True)
+    logger.info("Built %d templates for width %d in %s", len(names), width, folder)
+
+
+def connect(backend):
+    """Find the game window through backend, return a Screen for it
+
+    Nothing is found or loaded at import, this is the first step that touches
+    the emulator. Templates and the OCR engine load when first used.
+    """
+    with startup_phase("find_window"):
+        box = backend.find_window()
+    if box is None:
+        logger.error("Failed to find bluestacks, exiting")
         sys.exit(-1)
-    BLUESTACKS = Box(left, top, w, h)
+    w, h = box.w, box.h
+    if abs(h - fit_resolution(w)[1]) > h * ASPECT_TOLERANCE:
+        logger.error("Bad resolution (%d, %d), expected (%d, %d)", w, h, *fit_resolution(w))
+        sys.exit(-1)
+    scale = resolution_scale(w)
+    logger.info("Playing at (%d, %d), scale %.3f", w, h, scale)
+    templates = Templates.for_folder(template_folder(w, h))
+    return Screen(backend, box, scale, templates)
+
+
+_LOCAL = threading.local()
+
 
+def use_screen(screen):
+    """Make screen the default for Regions, Locs and the clock in this thread"""
+    _LOCAL.screen = screen
+
+
+def current_screen():
+    """The Screen of the bot running in this thread"""
+    return _LOCAL.screen
+
+
+def clock():
+    """Seconds on the backend's clock, simulated when replaying"""
+    return current_screen().backend.clock()
+
+
+def sleep(seconds):
+    """Wait on the backend's clock"""
+    with METRICS.timed("sleep", "sleep"):
+        current_screen().backend.sleep(seconds)
+
+
+class OcrCache:
+    """OCR results kept by a hash of the pixels they were read from (LRU)"""
+
+    def __init__(self, size=256):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Forget every result"""
+        with self._lock:
+            self._results.clear()
+
+    def read(self, pixels, backend):
+        """OCR a BGR array with backend, unless the exact same pixels were read before"""
+        key = (pixels.shape, hash(pixels.tobytes()))
+        with self._lock:
+            text = self._results.get(key)
+            if text is not None:
+                self.hits += 1
+                self._results.move_to_end(key)
+                return text
+            self.misses += 1
+        with METRICS.timed("ocr_engine"):
+            text = backend.ocr(pixels)
+        with self._lock:
+            self._results[key] = text
+            if len(self._results) > self.size:
+                self._results.popitem(last=False)
+        return text
+
+
+OCR_CACHE = OcrCache()
+
+
+def edit_distance(word, text, partial=False):
+    """Levenshtein distance from word to text, or to the closest part of text if partial"""
+    previous = [0] * (len(text) + 1) if partial else list(range(len(text) + 1))
+    for i, a in enumerate(word, 1):
+        current = [i]
+        for j, b in enumerate(text, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (a != b)))
+        previous = current
+    return min(previous) if partial else previous[-1]
+
+
+class Vocabulary:
+    """The words OCR text should be, to read through the garbles
+
+    Words sharing a trigram with the text are looked up in an index and
+    ranked by edit distance. A word matches if it's at most max_ratio of its
+    length away (at least one edit).
+    """
+
+    def __init__(self, words, max_ratio=0.25):
+        self.words = list(dict.fromkeys(words))
+        self.max_ratio = max_ratio
+        self._index = defaultdict(set)  # trigram: {word}
+        for word in self.words:
+            for trigram in self._trigrams(word):
+                self._index[trigram].add(word)
+
+    @staticmethod
+    def _trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _limit(self, word):
+        return max(1, int(len(word) * self.max_ratio))
+
+    def _candidates(self, text):
+        """Words sharing a trigram with text, or every word if none do"""
+        found = set()
+        for trigram in self._trigrams(text):
+            found |= self._index.get(trigram, set())
+        return found or self.words
+
+    def match(self, text):
+        """(word, distance) of the word text is, (None, None) if it's none of them"""
+        if text in self.words:
+            return text, 0
+        best = None, None
+        for word in self._candidates(text):
+            distance = edit_distance(word, text)
+            if distance <= self._limit(word) and (best[1] is None or distance < best[1]):
+                best = word, distance
+        return best
+
+    def find(self, text):
+        """{word: distance} of the words that appear somewhere in text"""
+        found = {}
+        for word in self._candidates(text):
+            distance = 0 if word in text else edit_distance(word, text, partial=True)
+            if distance <= self._limit(word):
+                found[word] = distance
+        return found
+
+
+class DigitReader:
+    """Read numbers in the game's white font by matching glyphs, no OCR
+
+    White text is cut into glyphs (connected blobs, scaled to size) and the
+    glyphs into words at the wider gaps. Digits are matched against known
+    glyphs, loaded from <digit>-<n>.png files in folders and learned from
+    text OCR read once the caller has checked it, which are saved to
+    save_folder.
+    """
+
+    def __init__(self, folders=(), save_folder=None, size=(8, 12), max_distance=0.15,
+                 min_white=200, exemplars=5):
+        self.save_folder = save_folder
+        self.size = size
+        self.max_distance = max_distance
+        self.min_white = min_white
+        self.exemplars = exemplars
+        self.glyphs = {digit: [] for digit in "0123456789"}
+        self._stacked = None  # (every known glyph as one array, their digits)
+        for folder in folders:
+            self.load(folder)
+
+    def load(self, folder):
+        """Add the glyph PNGs in folder, if it exists"""
+        if not folder or not os.path.isdir(folder):
+            return
+        for name in sorted(os.listdir(folder)):
+            match = re.fullmatch(r"(\d)-\d+\.png", name)
+            image = cv2.imread(os.path.join(folder, name), cv2.IMREAD_GRAYSCALE)
+            if match and image is not None:
+                self.glyphs[match.group(1)].append(self._normalize(image > 127))
+        self._stacked = None
+
+    def _normalize(self, mask):
+        """A glyph's boolean mask as a fixed size float array"""
+        return cv2.resize(mask.astype(np.float32), self.size, interpolation=cv2.INTER_AREA)
+
+    def words(self, pixels):
+        """The glyph masks in a BGR array of white text, grouped into words left to right"""
+        white = cv2.inRange(pixels, (self.min_white,) * 3, (255,) * 3)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(white, connectivity=8)
+        # Blobs shorter than half the tallest are noise or punctuation
+        blobs = sorted(stats[1:count].tolist())
+        tallest = max((blob[3] for blob in blobs), default=0)
+        blobs = [blob for blob in blobs if blob[3] * 2 >= tallest]
+        # Words are split where the gap is well over the usual gap between letters
+        gaps = [x - (px + pw) for (px, _, pw, _, _), (x, *_) in zip(blobs, blobs[1:])]
+        space = max(np.median(gaps) * 2.5, tallest * 0.2) if gaps else 0
+        words = []
+        for i, (x, y, w, h, _) in enumerate(blobs):
+            if i == 0 or gaps[i - 1] > space:
+                words.append([])
+            words[-1].append(white[y:y + h, x:x + w] > 0)
+        return words
+
+    def read_word(self, word):
+        """The digits in a word of glyph masks, None unless every glyph is a known digit"""
+        if self._stacked is None:
+            labels = [digit for digit, known in self.glyphs.items() for _ in known]
+            if not labels:
+                return None
+            known = np.stack([glyph for glyphs in self.glyphs.values() for glyph in glyphs])
+            self._stacked = known, labels
+        known, labels = self._stacked
+        if not word:
+            return None
+        glyphs = np.stack([self._normalize(glyph) for glyph in word])
+        # Distance of every glyph in the word to every known glyph at once
+        distances = np.abs(glyphs[:, np.newaxis] - known[np.newaxis]).mean(axis=(2, 3))
+        best = distances.argmin(axis=1)
+        if (distances[np.arange(len(word)), best] > self.max_distance).any():
+            return None
+        return "".join(labels[i] for i in best)
 
-win32gui.EnumWindows(window_callback, None)
-if BLUESTACKS is None:
-    logger.error("Failed to find bluestacks, exiting")
-    sys.exit(-1)
+    def learn(self, word, digits):
+        """Remember the glyphs of a word that's known to be digits"""
+        if len(word) != len(digits):
+            return
+        for glyph, digit in zip(word, digits):
+            known = self.glyphs[digit]
+            normalized = self._normalize(glyph)
+            if known:
+                closest = float(np.abs(np.stack(known) - normalized).mean(axis=(1, 2)).min())
+                if closest < self.max_distance / 3 or len(known) >= self.exemplars:
+                    continue  # Already have one like it, or enough
+            known.append(normalized)
+            self._stacked = None
+            if self.save_folder:
+                os.makedirs(self.save_folder, exist_ok=True)
+                path = os.path.join(self.save_folder, f"{digit}-{len(known)}.png")
+                cv2.imwrite(path, glyph.astype(np.uint8) * 255)
+            logger.debug("Learned a glyph for %s", digit)
+
+
+# Words in the window headings and shaft labels the bot reads
+HEADINGS = Vocabulary([
+    "manager", "mineshaft", "elevator", "warehouse", "mineoverview", "level",
+])
 
 
 class Region:
     """Areas relative to the top left of the Bluestacks window"""
 
-    def __init__(self, left, top, right, bottom, anchor=None, debug=False):
-        self.anchor = anchor if anchor is not None else BLUESTACKS
+    def __init__(self, left, top, right, bottom, anchor=None, debug=False, screen=None):
+        self.screen = screen or current_screen()
+        self.anchor = anchor if anchor is not None else self.screen.box
         # Original unchanging values
-        self._left = round(left * SCALE)
-        self._top = round(top * SCALE)
-        self._right = round(right * SCALE)
-        self._bottom = round(bottom * SCALE)
+        scale = self.screen.scale
+        self._left = round(left * scale)
+        self._top = round(top * scale)
+        self._right = round(right * scale)
+        self._bottom = round(bottom * scale)
         self.width = self._right - self._left
         self.height = self._bottom - self._top
         self.left = self._left
@@ -109,74 +1545,89 @@ class Region:
         self._update()
         return BoundingBox(self.left, self.top, self.right, self.bottom)
 
+    @instrumented("Region.ocr", "work")
     def ocr(self):
         """Read text inside region (lowercase, no spaces, no periods)"""
         if DEBUG:
             self.draw()
-        bbox = self.bounding_box()
-        assert bbox.bottom - bbox.top >= 20
-        results = OCR_READER.read_screen(bbox).as_string()
+        pixels, _ = self.screen.crop(self.box())
+        if pixels.shape[0] < OCR_MIN_HEIGHT:  # Regions shrink with the window
+            factor = OCR_MIN_HEIGHT / pixels.shape[0]
+            pixels = cv2.resize(pixels, None, fx=factor, fy=factor,
+                                interpolation=cv2.INTER_CUBIC)
+        results = OCR_CACHE.read(pixels, self.screen.backend)
         results = results.strip().replace(" ", "").replace(".", "").lower()
         return results
 
+    @instrumented("Region.draw", "debug")
     def draw(self, duration=0.5, times=1):
         """Move mouse around border of region"""
         self._update()
         for _ in range(times):
             if (self.left, self.top) != (0, 0):
-                pyautogui.moveTo(self.left, self.top, duration=0)
-            pyautogui.moveTo(self.right, self.top, duration=duration)
-            pyautogui.moveTo(self.right, self.bottom, duration=duration)
-            pyautogui.moveTo(self.left, self.bottom, duration=duration)
+                self.screen.move_to(self.left, self.top, duration=0)
+            self.screen.move_to(self.right, self.top, duration=duration)
+            self.screen.move_to(self.right, self.bottom, duration=duration)
+            self.screen.move_to(self.left, self.bottom, duration=duration)
             if (self.left, self.top) != (0, 0):
-                pyautogui.moveTo(self.left, self.top, duration=duration)
+                self.screen.move_to(self.left, self.top, duration=duration)
 
 
 class Loc:
     """A Point coordinate"""
 
-    def __init__(self, x, y, anchor=None, debug=False):
+    def __init__(self, x, y, anchor=None, debug=False, screen=None):
         """Create a new coordinate"""
         self.debug = debug or DEBUG
         self.x = x
         self.y = y
-        self.anchor = anchor if anchor is not None else BLUESTACKS
+        self.screen = screen or current_screen()
+        self.anchor = anchor if anchor is not None else self.screen.box
 
     def _update(self):
         """Update coords based on window position"""
-        rel_x = round(self.x * SCALE) + self.anchor.x
-        rel_y = round(self.y * SCALE) + self.anchor.y
+        rel_x = round(self.x * self.screen.scale) + self.anchor.x
+        rel_y = round(self.y * self.screen.scale) + self.anchor.y
         return Point(int(rel_x), int(rel_y))
 
     def loc(self):
         """Get the coords"""
         return self._update()
 
+    @instrumented("Loc.click", "work")
     def click(self):
         """Click the coords"""
         self.draw()
-        pyautogui.click(self._update())
+        self.screen.click(self._update())
 
+    @instrumented("Loc.get_color", "work")
     def get_color(self):
         """Get the pixel color"""
         x, y = self._update()
         self.draw()
-        return pyautogui.pixel(x, y)
+        return self.screen.pixel(x, y)
 
+    @instrumented("Loc.draw", "debug")
     def draw(self, wait=0.5):
         """Put pointer on coords"""
         if not self.debug:
             return
-        pyautogui.moveTo(self._update())
-        time.sleep(wait)
+        self.screen.move_to(self._update())
+        sleep(wait)
 
 
 class Color:
-    """Class to determine if a pixel is within a color range"""
+    """Class to determine if a pixel is within a color range
+
+    Compare one RGB tuple with ==, or test arrays of RGB pixels (Nx3 samples
+    or HxWx3 patches) all at once with mask, count and first.
+    """
 
     def __init__(self, color, crange=(0, 0, 0)):
         self.color = color
         self.crange = crange
+        self.lower = np.subtract(color, crange)
+        self.upper = np.add(color, crange)
 
     def __eq__(self, in_color):
         min_color = (
@@ -197,14 +1648,429 @@ class Color:
             return True
         return False
 
+    def mask(self, pixels):
+        """Boolean mask of the pixels (any shape ending in RGB) inside the range"""
+        pixels = np.asarray(pixels)
+        return np.all((pixels >= self.lower) & (pixels <= self.upper), axis=-1)
+
+    def count(self, pixels):
+        """Number of pixels inside the range"""
+        return int(np.count_nonzero(self.mask(pixels)))
+
+    def first(self, pixels):
+        """Index (Nx3) or Point (patch) of the first pixel inside the range, or None"""
+        hits = np.argwhere(self.mask(pixels))
+        if not len(hits):
+            return None
+        if hits.shape[1] == 1:
+            return int(hits[0, 0])
+        return Point(int(hits[0, 1]), int(hits[0, 0]))
+
+
+class Palette(dict):
+    """Named Colors with their ranges stacked, to test many colors in one pass"""
+
+    def __init__(self, colors):
+        super().__init__(colors)
+        self.names = list(self)
+        self.lower = np.array([c.lower for c in self.values()])
+        self.upper = np.array([c.upper for c in self.values()])
+
+    def _hits(self, pixels, names=None):
+        """Boolean array (..., colors) of which ranges each pixel is inside"""
+        lower, upper = self.lower, self.upper
+        if names is not None:
+            index = [self.names.index(name) for name in names]
+            lower, upper = lower[index], upper[index]
+        pixels = np.asarray(pixels)[..., np.newaxis, :]
+        return np.all((pixels >= lower) & (pixels <= upper), axis=-1)
+
+    def mask(self, pixels, names=None):
+        """Boolean mask of the pixels inside any of the named ranges"""
+        return self._hits(pixels, names).any(axis=-1)
+
+    def classify(self, pixels):
+        """Index into self.names of the first range each pixel is inside, -1 for none"""
+        hits = self._hits(pixels)
+        return np.where(hits.any(axis=-1), hits.argmax(axis=-1), -1)
+
+
+class ScreenClassifier:
+    """Tell which Window is showing from a tiny grayscale thumbnail of the frame
+
+    Thumbnails are learned whenever one of the slow checks (templates, OCR)
+    confirms a Window, and a new frame is matched against the closest one.
+    """
+
+    def __init__(self, size=(24, 42), exemplars=12, max_distance=12.0):
+        self.size = size
+        self.exemplars = exemplars
+        self.max_distance = max_distance
+        self._signatures = {window: [] for window in Window}
+
+    def signature(self, frame):
+        """Thumbnail of a BGR frame as float32"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def learn(self, window, frame):
+        """Remember a frame known to show window"""
+        signature = self.signature(frame)
+        signatures = self._signatures[window]
+        if signatures and self._distance(signature, signatures) < self.max_distance / 4:
+            return  # Already looks like one we have
+        signatures.append(signature)
+        del signatures[:-self.exemplars]
+
+    @staticmethod
+    def _distance(signature, signatures):
+        """Mean absolute difference to the closest of signatures"""
+        return float(np.abs(np.stack(signatures) - signature).mean(axis=(1, 2)).min())
+
+    def classify(self, frame):
+        """Return (Window, confidence 0-1) for a frame, (None, 0) if nothing is close"""
+        signature = self.signature(frame)
+        distances = sorted(
+            (self._distance(signature, signatures), window)
+            for window, signatures in self._signatures.items() if signatures
+        )
+        if not distances or distances[0][0] > self.max_distance:
+            return None, 0.0
+        distance, window = distances[0]
+        confidence = 1 - distance / self.max_distance
+        if len(distances) > 1:
+            # Not confident if the runner up is nearly as close
+            confidence = min(confidence, (distances[1][0] - distance) / self.max_distance)
+        return window, confidence
+
+
+class SearchRegions:
+    """Where each template has been found, so later searches look there first
+
+    A template's box is the window pixels around every hit so far, padded, and
+    is saved to path when it grows. Boxes are used once a template has
+    min_hits hits, for lookups of the first hit only. A miss in the box
+    searches the whole region again, in the pipeline's sweep at most once
+    every widen_interval seconds per template so buttons that are usually
+    absent stay cheap on every frame.
+    """
+
+    _shared = {}  # path: SearchRegions, shared by bots at the same resolution
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path=None, pad=20, min_hits=2, widen_interval=2.0):
+        self.path = path
+        self.pad = pad
+        self.min_hits = min_hits
+        self.widen_interval = widen_interval
+        self.boxes = {}  # image: [left, top, right, bottom] in window pixels
+        self.hits = defaultdict(int)
+        self._widened = {}  # image: clock of the last search of the whole region
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for image, saved in json.load(f).items():
+                    self.boxes[image] = saved["box"]
+                    self.hits[image] = saved["hits"]
+            logger.info("Loaded search regions for %d templates", len(self.boxes))
+
+    @classmethod
+    def for_screen(cls, screen):
+        """SearchRegions for screen's resolution, loaded once and then shared"""
+        path = os.path.join(SEARCH_REGIONS, f"{screen.box.w}x{screen.box.h}.json")
+        with cls._shared_lock:
+            if path not in cls._shared:
+                cls._shared[path] = cls(path, pad=round(20 * screen.scale))
+            return cls._shared[path]
+
+    def narrow(self, image, box, origin):
+        """Part of the screen Box to search first for image, None to search all of it"""
+        with self._lock:
+            learned = self.boxes.get(image)
+            if learned is None or self.hits[image] < self.min_hits:
+                return None
+        left = max(box.x, origin.x + learned[0])
+        top = max(box.y, origin.y + learned[1])
+        right = min(box.x + box.w, origin.x + learned[2])
+        bottom = min(box.y + box.h, origin.y + learned[3])
+        if right <= left or bottom <= top or (right - left, bottom - top) == (box.w, box.h):
+            return None
+        return Box(left, top, right - left, bottom - top)
+
+    def should_widen(self, image, now):
+        """True if a miss inside the learned box should be checked against the region"""
+        with self._lock:
+            if now - self._widened.get(image, -self.widen_interval) < self.widen_interval:
+                return False
+            self._widened[image] = now
+            return True
+
+    def record(self, image, matches, origin):
+        """Count screen Matches for image and grow its box to cover them"""
+        if not matches:
+            return
+        with self._lock:
+            self.hits[image] += len(matches)
+            old = self.boxes.get(image)
+            box = list(old) if old else [float("inf"), float("inf"), 0, 0]
+            for m in matches:
+                left, top = m.left - origin.x, m.top - origin.y
+                box = [
+                    min(box[0], max(left - self.pad, 0)),
+                    min(box[1], max(top - self.pad, 0)),
+                    max(box[2], left + m.width + self.pad),
+                    max(box[3], top + m.height + self.pad),
+                ]
+            self.boxes[image] = box
+            if box != old or self.hits[image] == self.min_hits:
+                self._save()
+
+    def _save(self):
+        """Write every box to path, swapped in whole"""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        saved = {image: {"box": box, "hits": self.hits[image]}
+                 for image, box in sorted(self.boxes.items())}
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(saved, f, indent=1)
+        os.replace(self.path + ".tmp", self.path)
+
+
+class ManagerRoster:
+    """Every super manager seen in each area's manager list
+
+    Filled in page by page while scanning the list. Each entry is a dict with
+    the page it was on (drags from the top), whether it looked ready and when
+    it was last seen. A roster older than max_age is scanned again.
+    """
+
+    def __init__(self, max_age=60 * 60):
+        self.max_age = max_age
+        self.entries = {area: {} for area in MineArea}  # area: {name: entry}
+        self.scanned = {area: None for area in MineArea}  # area: clock of the last scan
+
+    def see(self, area, name, page, ready, now):
+        """Record a manager on a page of the list"""
+        self.entries[area][name] = {"page": page, "ready": ready, "last_seen": now}
+
+    def used(self, area, name, now):
+        """A manager was just assigned, it won't be ready for a while"""
+        entry = self.entries[area].get(name)
+        if entry is not None:
+            entry["ready"] = False
+            entry["last_seen"] = now
+
+    def best(self, area, durations, now):
+        """(name, entry) of the ready manager with the longest boost, None to rescan"""
+        scanned = self.scanned[area]
+        if scanned is None or now - scanned > self.max_age:
+            return None
+        ready = [(durations.get(name, 0), name) for name, entry in self.entries[area].items()
+                 if entry["ready"]]
+        if not ready:
+            return None
+        _, name = max(ready)
+        return name, self.entries[area][name]
+
+
+class ManagerStore:
+    """Assignments, boosts and cooldowns of every super manager, kept across runs
+
+    Events are appended to managers.jsonl and folded into the state. Every
+    compact_every events the state is written to managers.json and the log is
+    emptied; loading replays the log on top of that snapshot. Times are wall
+    clock (time.time()) so they mean the same after a restart.
+
+    A manager's cooldown is learned from boosting them and later seeing them
+    ready again. Until it's known, they're expected back recheck seconds
+    after the longest time they've been seen still cooling down.
+    """
+
+    def __init__(self, folder, compact_every=100, recheck=10 * 60):
+        self.log_path = os.path.join(folder, "managers.jsonl")
+        self.snapshot_path = os.path.join(folder, "managers.json")
+        self.compact_every = compact_every
+        self.recheck = recheck
+        self.managers = {}  # "AREA/name": state
+        self.areas = {}  # "AREA": {"name", "boost_end", "scanned"}
+        self._logged = 0
+        os.makedirs(folder, exist_ok=True)
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.managers, self.areas = snapshot["managers"], snapshot["areas"]
+        if os.path.exists(self.log_path):
+            with open(self.log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except ValueError:
+                        logger.warning("Skipping bad line in %s", self.log_path)
+                    self._logged += 1
+        logger.info("Loaded %d managers from %s", len(self.managers), folder)
+
+    def record(self, event, area, name=None, **fields):
+        """Log an event (seen, assign, boost, scan) for a manager or an area"""
+        entry = {"t": time.time(), "event": event, "area": area.name, "name": name, **fields}
+        self._apply(entry)
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self._logged += 1
+        if self._logged >= self.compact_every:
+            self.compact()
+
+    def _apply(self, entry):
+        """Fold one event into the state"""
+        t, event, area, name = entry["t"], entry["event"], entry["area"], entry["name"]
+        area_state = self.areas.setdefault(area, {})
+        if event == "scan":
+            area_state["scanned"] = t
+            return
+        state = self.managers.setdefault(f"{area}/{name}", {
+            "area": area, "name": name, "page": None, "ready": None, "last_seen": None,
+            "boost_start": None, "duration": None, "cooldown": None, "cooling": 0,
+            "boosts": 0,
+        })
+        if event == "seen":
+            state.update(page=entry["page"], ready=entry["ready"], last_seen=t)
+            if state["boost_start"] is not None and state["cooling"] is not None:
+                since = t - state["boost_start"]
+                if not entry["ready"]:
+                    state["cooling"] = max(state["cooling"], since)
+                else:
+                    # The first time they're ready again, an upper bound
+                    cooldown = state["cooldown"]
+                    state["cooldown"] = since if cooldown is None else min(cooldown, since)
+                    state["cooling"] = None
+        elif event == "assign":
+            area_state["name"] = name
+        elif event == "boost":
+            state.update(ready=False, boost_start=t, duration=entry["duration"], cooling=0)
+            state["boosts"] += 1
+            area_state.update(name=name, boost_end=t + entry["duration"])
+
+    def compact(self):
+        """Write the state as a snapshot and start an empty log"""
+        with open(self.snapshot_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"managers": self.managers, "areas": self.areas}, f, indent=1)
+        os.replace(self.snapshot_path + ".tmp", self.snapshot_path)
+        with open(self.log_path, "w", encoding="utf-8"):
+            pass
+        self._logged = 0
+
+    def ready_at(self, state):
+        """Wall clock time a manager should be ready, in the past if they are"""
+        if state["ready"]:
+            return state["last_seen"]
+        start = state["boost_start"]
+        if start is None:
+            seen = state["last_seen"]
+            return 0 if seen is None else seen + self.recheck
+        if state["cooldown"] is not None:
+            return start + state["cooldown"]
+        return start + max(state["duration"], state["cooling"] or 0) + self.recheck
+
+    def next_ready(self, area):
+        """Wall clock time the first of an area's managers is ready, None if none known"""
+        times = [self.ready_at(state) for state in self.managers.values()
+                 if state["area"] == area.name and state["name"]]
+        return min(times) if times else None
+
+    def area(self, area):
+        """{"name", "boost_end", "scanned"} of what's known about an area"""
+        return self.areas.get(area.name, {})
+
+    def states(self, area):
+        """The state of every manager seen in an area"""
+        return [state for state in self.managers.values() if state["area"] == area.name]
+
+
+class Task:
+    """A piece of work play() repeats, with its own schedule"""
+
+    def __init__(self, name, func, interval, value=1.0, cost=1.0, deadline=None):
+        self.name = name
+        self.func = func
+        self.interval = interval  # Minimum seconds between runs
+        self.value = value
+        self.cost = cost  # Seconds per run, updated after every run
+        self.deadline = deadline  # Returns the earliest time it's worth running
+        self.next_due = clock()
+        self.runs = 0
+
+    def due(self):
+        """Earliest time this should run again"""
+        if self.deadline is None:
+            return self.next_due
+        return max(self.next_due, self.deadline())
+
+    def priority(self):
+        """Value per second spent"""
+        return self.value / max(self.cost, 0.01)
+
+
+class Scheduler:
+    """Run the most valuable due Task first and sleep until the next is due"""
+
+    def __init__(self, tasks, max_idle=5.0):
+        self.max_idle = max_idle
+        self._queue = []
+        self._count = 0
+        for task in tasks:
+            self._push(task)
+
+    def _push(self, task):
+        self._count += 1
+        heapq.heappush(self._queue, (task.due(), self._count, task))
+
+    def _pop_due(self, now):
+        """Pop every task that's due, re-queueing any whose deadline moved later"""
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            _, _, task = heapq.heappop(self._queue)
+            if task.due() > now:
+                self._push(task)
+            else:
+                due.append(task)
+        return due
+
+    def run_once(self):
+        """Run one task, or idle until one is due. Returns the task run or None"""
+        now = clock()
+        due = self._pop_due(now)
+        if not due:
+            wait = self._queue[0][0] - now if self._queue else self.max_idle
+            sleep(min(max(wait, 0), self.max_idle))
+            return None
+        due.sort(key=lambda t: t.priority(), reverse=True)
+        task = due[0]
+        for other in due[1:]:
+            self._push(other)
+        logger.debug("Running %s (priority %.2f)", task.name, task.priority())
+        start = clock()
+        with METRICS.timed("task:" + task.name):
+            task.func()
+        end = clock()
+        task.cost = 0.8 * task.cost + 0.2 * (end - start) if task.runs else end - start
+        task.runs += 1
+        task.next_due = end + task.interval
+        self._push(task)
+        return task
+
 
 class IdleMinerTycoon:
     """Play the game"""
 
-    def __init__(self):
+    def __init__(self, screen=None, pipeline=False, name="default"):
+        self.screen = screen or connect(WindowsBackend())
+        use_screen(self.screen)
+        # Capture, detect and watch for Edgar in the background while playing
+        self.pipeline = Pipeline(self.screen) if pipeline else None
+        self.edgar_watcher = EdgarWatcher(self) if pipeline else None
         self.confidence = 0.8
-        self.last_edgar_time = time.perf_counter()
-        self.last_edgar_search_time = time.perf_counter()
+        self.last_edgar_time = clock()
+        self.last_edgar_search_time = clock()
         self.last_upgrade_time = 0
         self.area_needs_leveling: MineArea = MineArea.MINESHAFT
         self.mine: MineMode = MineMode.REGULAR
@@ -216,7 +2082,13 @@ class IdleMinerTycoon:
             MineArea.ELEVATOR: {"known": False, "boosted": True},
             MineArea.WAREHOUSE: {"known": False, "boosted": True},
         }
-        self.region_game = Region(0, 32, BLUESTACKS.w - 32, BLUESTACKS.h)
+        self.region_game = Region(0, 32, self.screen.box.w - 32, self.screen.box.h)
+        # self.region_edgar = Region(355, 900, 560, 1060)
+        self.region_edgar = Region(228, 578, 359, 680)
+        self.screen_classifier = ScreenClassifier()
+        self.screen_confidence = 0.5
+        self.search_regions = SearchRegions.for_screen(self.screen)
+        self.roster = ManagerRoster()
         self.always_buttons = [
             "free.png", "edgar.png", "free-idle.png",  # "30m-skip.png",
             "remove-barrier.png", "collect.png", "free-idle.png", "free.png",
@@ -224,30 +2096,20 @@ class IdleMinerTycoon:
             "close-blue.png", "get.png",
         ]
         self.mgrs = {
-            # Mineshaft
-            'pebble': 2, 'mrturner': 0.5, 'rangersue': 1, 'zigalvani': 1,
-            'blingsley': 1, 'chester': 5, 'goodmanjr': 5, 'gordon': 5,
-            'greenidler': 1, 'cliffwalker': 0.5, 'drsteiner': 5,
-            'rabbidblingsley': 2.5, 'sirlorenzo': 1,
-            # Elevator
-            'queenaurora': 2.5, 'drlilly': 5, 'damianjones': 5, 'sojo': 5,
-            'mrsgoodman': 5, 'leevatori': 5, 'ezioauditore': 1,
-            'zephyria': 2.5,
-            # Warehouse
-            'professormaple': 1, 'drnova': 5, 'luxario': 1, 'mark': 5,
-            'mrgoodman': 5, 'octaviadevere': 2.5, 'chriscapella': 5,
-            'jadekim': 5,
+            name: minutes for managers in SUPER_MANAGERS.values()
+            for name, minutes in managers.items()
         }
+        self.manager_names = Vocabulary(self.mgrs)
         # The heading at the top of the panel to choose managers.
         # Mineshaft XX Manager, Elevator Manager, Warehouse
         self.region_manager_chooser_heading = Region(88, 105, 304, 132)
-        # next_change_time[area] = time.perf_counter()
+        # next_change_time[area] = clock()
         self.next_change_time = {
-            MineArea.MINESHAFT: time.perf_counter(),
-            MineArea.ELEVATOR: time.perf_counter(),
-            MineArea.WAREHOUSE: time.perf_counter()
+            MineArea.MINESHAFT: clock(),
+            MineArea.ELEVATOR: clock(),
+            MineArea.WAREHOUSE: clock()
         }
-        self.colors = {
+        self.colors = Palette({
             # Boost colors
             "mgr_red": Color((255, 94, 71), (0, 4, 1)),  # Super Managers
             "mgr_green": Color((205, 255, 132), (6, 0, 3)),  # Executive
@@ -261,79 +2123,222 @@ class IdleMinerTycoon:
             "cycle_orange_dark": Color((252, 210, 64), (10, 10, 10)),
             "upgrade_arrow_left": Color((255, 230, 123), (5, 10, 10)),
             "upgrade_arrow_right": Color((255, 208, 2), (0, 10, 10)),
-        }
+        })
+        # Mine Overview boost bar colors, named after BoostStates
+        self.boost_colors = Palette({
+            "ACTIVE": Color((255, 243, 115)),
+            "RECOVERING": Color((183, 183, 183)),
+            "READY": Color((11, 92, 147)),  # Background blue
+        })
+        self.manager_store = ManagerStore(os.path.join(MANAGER_STORE, name))
+        w, h = self.screen.box.w, self.screen.box.h
+        self.digits = DigitReader(
+            [os.path.join(SCRIPT_DIR, f"{nw}x{nh}", "digits") for nw, nh in NATIVE_RESOLUTIONS]
+            + [os.path.join(DIGITS, f"{w}x{h}")],
+            save_folder=os.path.join(DIGITS, f"{w}x{h}"))
+        self._restore_managers()
+
+    @staticmethod
+    def _from_wall(t):
+        """Convert a wall clock time from the manager store to clock()"""
+        return clock() + t - time.time()
+
+    def _restore_managers(self):
+        """Pick up the roster and running boosts from the manager store"""
+        now = time.time()
+        for area in MineArea:
+            known = self.manager_store.area(area)
+            if "scanned" in known:
+                self.roster.scanned[area] = self._from_wall(known["scanned"])
+            for state in self.manager_store.states(area):
+                if state["page"] is not None:
+                    ready = self.manager_store.ready_at(state) <= now
+                    self.roster.see(area, state["name"], state["page"], ready,
+                                    self._from_wall(state["last_seen"]))
+            if known.get("boost_end", 0) > now:
+                self.next_change_time[area] = self._from_wall(known["boost_end"])
+                self.current_mgr[area]["known"] = known["name"] in self.mgrs
+                self.current_mgr[area]["boosted"] = True
+                logger.info("%s is boosted by %s for another %ds", area.name,
+                            known["name"], known["boost_end"] - now)
+
+    def _refresh_roster(self, area):
+        """Mark managers ready whose cooldown should be over"""
+        now = time.time()
+        for state in self.manager_store.states(area):
+            entry = self.roster.entries[area].get(state["name"])
+            if entry is not None and not entry["ready"]:
+                entry["ready"] = self.manager_store.ready_at(state) <= now
 
     def find_image_timeout(self, image, timeout, click=False, confidence=None, region=None):
         """Wrap the find_image function with a timeout to search for N seconds"""
-        end_time = time.perf_counter() + timeout
-        while time.perf_counter() < end_time:
+        end_time = clock() + timeout
+        while clock() < end_time:
             ret = self.find_image(image, click, confidence, region)
             if ret:
                 return ret
+            self.screen.invalidate()
         logger.warning("Couldn't find %s after %ds", image, timeout)
         return None
 
+    @instrumented("find_image", "work")
     def find_image(self, image, click=False, confidence=None, region=None):
         """Search for an image in a region"""
-        c = confidence or self.confidence
-        r = region or self.region_game
         action = "Clicked" if click else "Found"
-        if not os.path.exists(image):
-            logger.error("%s does not exist", image)
-            return None
-        try:
-            loc = pyautogui.locateCenterOnScreen(image, confidence=c, region=r.box())
-        except (pyautogui.ImageNotFoundException, pyscreeze.ImageNotFoundException):
-            return None
-        if loc is not None:
+        loc = self.locate_center(image, confidence, region)
+        if loc:
             if click:
-                pyautogui.click(loc)
+                self.screen.click(loc)
             logger.debug("%s %s at %s", action, image, loc)
-        return loc
+        return loc or None
+
+    def _match(self, needle, box, confidence, limit, frame=None, small=None):
+        """Search a screen Box of frame for needle, return screen Matches
+
+        small is the half-size copy of that crop when the caller already has it.
+        """
+        haystack, origin = self.screen.crop(box, frame)
+        return [
+            Match(origin.x + m.left, origin.y + m.top, m.width, m.height)
+            for m in match_template(haystack, needle, confidence, limit, small=small)
+        ]
+
+    def _locate(self, image, confidence, region, limit=None, throttle=False, frame=None,
+                small=None):
+        """Search the shared frame for an image, where it was seen before first
 
+        Only single lookups (limit=1) try the learned box, every hit is searched
+        for in the whole region. With throttle, a miss in the box only widens as
+        often as SearchRegions allows. frame and small are passed on to _match,
+        small only for the whole region.
+        """
+        box = (region or self.region_game).box()
+        c = confidence or self.confidence
+        needle = self.screen.templates.get(image)
+        origin = Point(self.screen.box.x, self.screen.box.y)
+        narrow = limit == 1 and self.search_regions.narrow(image, box, origin)
+        if narrow:
+            matches = self._match(needle, narrow, c, limit, frame)
+            if matches or (throttle and not self.search_regions.should_widen(image, clock())):
+                self.search_regions.record(image, matches, origin)
+                return matches
+        matches = self._match(needle, box, c, limit, frame, small)
+        self.search_regions.record(image, matches, origin)
+        return matches
+
+    @staticmethod
+    def _find_images_key(images, confidence, region):
+        """Pipeline watch key for a find_images call"""
+        return ("find_images", tuple(dict.fromkeys(images)), confidence, region)
+
+    @instrumented("find_images", "work")
+    def find_images(self, images, confidence=None, region=None):
+        """Search one frame for a list of images, return {image: center Point} of hits"""
+        if self.pipeline:
+            ready = self.pipeline.result(self._find_images_key(images, confidence, region))
+            if ready is not None:
+                return dict(ready)
+        return self._find_images(images, confidence, region)
+
+    def _find_images(self, images, confidence, region, throttle=False, frame=None):
+        """find_images without the pipeline, also what the pipeline runs (throttled)
+
+        The whole batch reads one frame, the shared one unless a (pixels, Box)
+        frame is given. Its region crop is halved once for the coarse pass of
+        every template instead of once per template.
+        """
+        frame = frame or self.screen.frame()
+        haystack, _ = self.screen.crop((region or self.region_game).box(), frame)
+        small = cv2.pyrDown(haystack)
+        hits = {}
+        for image in dict.fromkeys(images):  # Drop duplicates, keep order
+            if self.screen.templates.get(image) is None:
+                continue
+            matches = self._locate(image, confidence, region, limit=1, throttle=throttle,
+                                   frame=frame, small=small)
+            if matches:
+                hits[image] = center(matches[0])
+        return hits
+
+    def click_images(self, images, confidence=None, region=None, wait=0):
+        """Click each image in the list that's on screen, in order
+
+        One search of the frame covers the whole list, it's only repeated
+        for the images after one that got clicked since the click changes
+        the screen.
+        """
+        remaining = list(dict.fromkeys(images))
+        clicked = []
+        while remaining:
+            hits = self.find_images(remaining, confidence, region)
+            if not hits:
+                break
+            image, loc = next(iter(hits.items()))
+            self.screen.click(loc)
+            logger.debug("Clicked %s at %s", image, loc)
+            clicked.append(image)
+            remaining = remaining[remaining.index(image) + 1:]
+            if wait:
+                self.settle(wait, image)
+        return clicked
+
+    @instrumented("locate_center", "work")
     def locate_center(self, image, confidence=None, region=None):
         """Wrapper to catch exceptions"""
-        if not os.path.exists(image):
-            logger.error("%s does not exist", image)
+        if self.screen.templates.get(image) is None:
             return False
-        r = region or self.region_game
-        c = confidence or self.confidence
-        try:
-            result = pyautogui.locateCenterOnScreen(
-                image, confidence=c, region=r.box())
-        except (pyautogui.ImageNotFoundException, pyscreeze.ImageNotFoundException):
+        matches = self._locate(image, confidence, region, limit=1)
+        if not matches:
             return None
-        return result
+        return center(matches[0])
 
+    @instrumented("locate_all", "work")
     def locate_all(self, image, confidence=None, region=None):
         """Wrapper to catch exceptions"""
-        if not os.path.exists(image):
-            logger.error("%s does not exist", image)
+        if self.screen.templates.get(image) is None:
             return False
-        r = region or self.region_game
-        c = confidence or self.confidence
-        try:
-            result = list(pyautogui.locateAllOnScreen(
-                image, confidence=c, region=r.box()))
-        except (pyautogui.ImageNotFoundException, pyscreeze.ImageNotFoundException):
-            return None
-        return result
+        return distinct(self._locate(image, confidence, region)) or None
+
+    def classify_screen(self, frame=None):
+        """Guess which Window is showing, returns (Window or None, confidence)"""
+        if frame is None:
+            frame, _ = self.screen.crop(self.region_game.box())
+        return self.screen_classifier.classify(frame)
+
+    def _looks_like(self, window):
+        """True if the classifier is confident window is showing"""
+        found, confidence = self.classify_screen()
+        if found == window and confidence >= self.screen_confidence:
+            logger.debug("Classified screen as %s (%.2f)", window.name, confidence)
+            return True
+        return False
+
+    def _learn_screen(self, window):
+        """Teach the classifier what window looks like using the current frame"""
+        frame, _ = self.screen.crop(self.region_game.box())
+        self.screen_classifier.learn(window, frame)
 
     def verify_in_shaft(self, timeout=3):
         """Make sure it looks like we're in a mineshaft"""
-        end_time = time.perf_counter() + timeout
-        while time.perf_counter() < end_time:
+        if self._looks_like(Window.SHAFT):
+            return True
+        end_time = clock() + timeout
+        while clock() < end_time:
             all_levels = self.locate_all("level.png", confidence=0.7)
             if all_levels:
+                self._learn_screen(Window.SHAFT)
                 return True
+            self.screen.invalidate()
         logger.error("Can't find shaft!")
         return True
 
     def verify_in_game(self, timeout=3):
         """Make sure it looks like we're still in the game"""
-        end_time = time.perf_counter() + timeout
+        if self._looks_like(Window.SHAFT):
+            return True
+        end_time = clock() + timeout
         iters = 0
-        while time.perf_counter() < end_time:
+        while clock() < end_time:
             if self.find_image("shovel.png"):
                 return True
             if self.find_image("shop.png"):  # get shop with !
@@ -343,42 +2348,45 @@ class IdleMinerTycoon:
             if self.find_image("frontier-shop2.png"):
                 return True
             iters += 1
+            self.screen.invalidate()
         logger.error("Can't find shovel/shop to verify in game! %d", iters)
         return False
 
     def verify_in_manager_window(self, area: MineArea):
         """Make sure the manager choosing window is in the foreground"""
+        if self._looks_like(Window.MANAGER_CHOOSER):
+            return True
         region = self.region_manager_chooser_heading
-        end_time = time.perf_counter() + 3
+        end_time = clock() + 3
         iters = 0
-        while time.perf_counter() < end_time:
+        while clock() < end_time:
             ocr = region.ocr()
             logger.debug("OCR: Manager window title: %s", ocr)
-            if "manager" in ocr or "hanager" in ocr:
-                return True
-            elif (area == MineArea.MINESHAFT and ("mine" in ocr or "shaft" in ocr)):
+            words = HEADINGS.find(ocr)
+            if "manager" in words or area.name.lower() in words:
+                self._learn_screen(Window.MANAGER_CHOOSER)
                 return True
-            elif (area == MineArea.WAREHOUSE and ("ware" in ocr or "house" in ocr)):
-                return True
-            else:
-                if "ele" in ocr or "vator" in ocr:
-                    return True
-            time.sleep(0.25)
+            sleep(0.25)
+            self.screen.invalidate()
             iters += 1
         logger.error("Manager window not found via OCR: %s (%d iters)", ocr, iters)
         return False
 
     def verify_in_mine_overview(self):
         """Make sure we're in the Mine Overview window"""
+        if self._looks_like(Window.MINE_OVERVIEW):
+            return True
         heading = Region(95, 95, 275, 125)
-        end_time = time.perf_counter() + 3
-        while time.perf_counter() < end_time:
+        end_time = clock() + 3
+        while clock() < end_time:
             ocr = heading.ocr()
             logger.debug("Mine overview OCR = %s", ocr)
-            if "mineoverview" in ocr or "måneovervåew" in ocr or "over" in ocr:
+            if "mineoverview" in HEADINGS.find(ocr):
                 logger.debug("Mine overview found via OCR")
+                self._learn_screen(Window.MINE_OVERVIEW)
                 return True
-            time.sleep(0.25)
+            sleep(0.25)
+            self.screen.invalidate()
         logger.error('Mine overview not found in "%s"', ocr)
         return False
 
@@ -392,7 +2400,7 @@ class IdleMinerTycoon:
         else:
             down_arrow = Loc(25, 655)
             down_arrow.click()
-        time.sleep(2)
+        self.settle(2, "scroll_shaft")
         return True
 
     def goto_mineshaft_bottom(self):
@@ -405,12 +2413,12 @@ class IdleMinerTycoon:
         if not loc:
             logger.error("No last manager found")
             return None
-        return Point(loc[0] - round(150 * SCALE), loc[1])
+        return Point(loc[0] - round(150 * self.screen.scale), loc[1])
 
     def get_last_level(self):
         """Get the location of the bottom-most 'Level' button"""
         self.goto_mineshaft_bottom()
-        time.sleep(2)  # extra time
+        self.settle(2, "scroll_shaft")
         all_levels = self.locate_all("level.png", confidence=0.7)
         if not all_levels:
             logger.error("No level icon found")
@@ -424,7 +2432,7 @@ class IdleMinerTycoon:
         else:
             arrow = Loc(50, 606)
         arrow.click()
-        time.sleep(2)
+        self.settle(2, "scroll_overview")
         return True
 
     def goto_mine_overview_bottom(self):
@@ -438,6 +2446,47 @@ class IdleMinerTycoon:
             return False
         return True
 
+    def read_mine_overview(self):
+        """Read the open Mine Overview into an OverviewSnapshot
+
+        Everything but the mineshaft's boost bar is in the frame at the top,
+        the list is only scrolled to the bottom when the mineshaft's manager
+        isn't known.
+        """
+        self.goto_mine_overview_top()
+        exclamation = self.find_image("exclamation.png")
+        needs_leveling = None
+        if exclamation is not None:
+            y = exclamation[1] - self.region_game.top
+            if y < round(200 * self.screen.scale):
+                needs_leveling = MineArea.WAREHOUSE
+            elif y < round(350 * self.screen.scale):
+                needs_leveling = MineArea.ELEVATOR
+            else:
+                needs_leveling = MineArea.MINESHAFT
+        boosts = {}
+        if self.mine != MineMode.FRONTIER:
+            boosts.update(self._read_boost_bars({
+                MineArea.WAREHOUSE: Loc(174, 273),
+                MineArea.ELEVATOR: Loc(174, 417),
+            }))
+            if not self.current_mgr[MineArea.MINESHAFT]["known"]:
+                self.goto_mine_overview_bottom()
+                boosts.update(self._read_boost_bars({MineArea.MINESHAFT: Loc(174, 613)}))
+        return OverviewSnapshot(needs_leveling, exclamation, boosts)
+
+    def _read_boost_bars(self, bars):
+        """{MineArea: BoostState} from the color of each area's boost bar Loc"""
+        colors = self.screen.sample([bar.loc() for bar in bars.values()])
+        states = {}
+        for area, color, index in zip(bars, colors, self.boost_colors.classify(colors)):
+            if index < 0:
+                logger.debug("%s boost bar is %s", area.name, tuple(color.tolist()))
+                states[area] = BoostState.UNKNOWN
+            else:
+                states[area] = BoostState[self.boost_colors.names[index]]
+        return states
+
     def mine_overview(self):
         """Open mine overview, see what area needs leveling up"""
         if not self.open_mine_overview():
@@ -448,105 +2497,102 @@ class IdleMinerTycoon:
             logger.error("Can't verify in mine overview")
             return False
 
-        self.goto_mine_overview_top()
+        overview = self.read_mine_overview()
+        logger.debug("Mine overview: %s", overview)
+        for area, state in overview.boosts.items():
+            if self.current_mgr[area]["known"]:
+                continue
+            if state == BoostState.ACTIVE:
+                if self.current_mgr[area]["boosted"]:
+                    logger.debug("%s boost in progress", area.name)
+                else:
+                    logger.info("%s manager is boosted", area.name)
+                self.current_mgr[area]["boosted"] = True
+            else:
+                self.current_mgr[area]["boosted"] = False
+                if state == BoostState.RECOVERING:
+                    logger.debug("%s manager recovering", area.name)
+                else:
+                    logger.debug("%s manager ready to boost", area.name)
 
-        loc = self.find_image_timeout("exclamation.png", timeout=2)
-        if loc is None:
+        if overview.needs_leveling is None:
             logger.error("Exclamation not found")
-            time.sleep(1)
-            pyautogui.press(["esc"])
-            time.sleep(1)
-            return False
-
-        prev_anl = self.area_needs_leveling
-        y = loc[1] - self.region_game.top
-        if y < round(200 * SCALE):
-            self.area_needs_leveling = MineArea.WAREHOUSE
-            if self.maxed_warehouse:
+        else:
+            prev_anl = self.area_needs_leveling
+            self.area_needs_leveling = overview.needs_leveling
+            if self.area_needs_leveling == MineArea.WAREHOUSE and self.maxed_warehouse:
                 if self.maxed_elevator:
                     self.area_needs_leveling = MineArea.MINESHAFT
                 else:
                     self.area_needs_leveling = MineArea.ELEVATOR
-        elif y < round(350 * SCALE):
-            self.area_needs_leveling = MineArea.ELEVATOR
-            if self.maxed_elevator:
+            elif self.area_needs_leveling == MineArea.ELEVATOR and self.maxed_elevator:
                 if self.maxed_warehouse:
                     self.area_needs_leveling = MineArea.MINESHAFT
                 else:
                     self.area_needs_leveling = MineArea.WAREHOUSE
-        else:
-            self.area_needs_leveling = MineArea.MINESHAFT
-            if self.maxed_mineshaft:
+            elif self.area_needs_leveling == MineArea.MINESHAFT and self.maxed_mineshaft:
                 if self.maxed_elevator:
                     self.area_needs_leveling = MineArea.WAREHOUSE
                 else:
                     self.area_needs_leveling = MineArea.ELEVATOR
-
-        if self.area_needs_leveling != prev_anl:
-            logger.info("%s area needs leveling!", self.area_needs_leveling.name)
-
-        active_boost_color = Color((255, 243, 115))
-        recovery_color = Color((183, 183, 183))
-        background_blue_color = Color((11, 92, 147))  # when ready to boost
-        bars = dict()
-        bars[MineArea.WAREHOUSE] = Loc(174, 273)
-        bars[MineArea.ELEVATOR] = Loc(174, 417)
-        bars[MineArea.MINESHAFT] = Loc(174, 613)
-        for area in MineArea:
-            if self.mine in (MineMode.FRONTIER, ):
-                break
-            if not self.current_mgr[area]["known"]:
-                if area == MineArea.MINESHAFT:
-                    self.goto_mine_overview_bottom()
-                else:
-                    self.goto_mine_overview_top()
-
-                loc = bars[area]
-                pix = loc.get_color()
-                if pix == active_boost_color:
-                    if self.current_mgr[area]["boosted"]:
-                        logger.debug("%s boost in progress", area.name)
-                    else:
-                        logger.info("%s manager is boosted", area.name)
-                    self.current_mgr[area]["boosted"] = True
-                else:
-                    self.current_mgr[area]["boosted"] = False
-                    if pix == recovery_color:
-                        logger.debug("%s manager recovering", area.name)
-                    elif pix == background_blue_color:
-                        logger.debug("%s manager ready to boost", area.name)
-                    else:
-                        logger.debug("%s manager ready to boost %s", area.name, pix)
+            if self.area_needs_leveling != prev_anl:
+                logger.info("%s area needs leveling!", self.area_needs_leveling.name)
 
         # Exit mine overview
-        pyautogui.press(["esc"])
-        time.sleep(1)
-        return True
+        self.screen.press(["esc"])
+        self.settle(1, "esc")
+        return overview.needs_leveling is not None
+
+    def read_shaft_heading(self, region, expected_shaft=None):
+        """(shaft, level) from a "Mineshaft 12 Level 400" heading, or None
+
+        The digits are matched against glyphs, OCR (very unreliable here) is
+        only used when a glyph isn't known yet. It only teaches the reader
+        the shaft number's glyphs, and only when it read expected_shaft, since
+        a misread glyph would be trusted from then on.
+        """
+        pixels, _ = self.screen.crop(region.box())
+        words = self.digits.words(pixels)
+        if len(words) == 4:
+            shaft, level = self.digits.read_word(words[1]), self.digits.read_word(words[3])
+            if shaft and level:
+                return int(shaft), int(level)
+        text = region.ocr()
+        match = re.search(r"ft(\d+)lev\D*(\d+)", text)
+        if match is None or "mineshaft" not in HEADINGS.find(text):
+            logger.debug("Not a mineshaft heading: %s", text)
+            return None
+        shaft = int(match.group(1))
+        if len(words) == 4 and shaft == expected_shaft:
+            self.digits.learn(words[1], match.group(1))
+        return shaft, int(match.group(2))
 
     def max_all_mines(self):
         """Starting from the last mine, max all of them"""
         left_arrow = Loc(10, 380)
         heading_region = Region(41, 94, 317, 131)
+        heading = None
         for _ in range(35):
             left_arrow.click()
-            time.sleep(1)
-            text = heading_region.ocr()  # This OCR is very unreliable
-            if not (self.find_image("mineshaft.png") or 'mineshaft' in text
-                    or 'mdne' in text or 'mbne' in text):
-                logger.error("Not looking at a mineshaft, not maxing: %s", text)
+            self.settle(1, "next_mine")
+            # Each click goes down a shaft, which is what checks the digits OCR read
+            expected = heading[0] - 1 if heading else None
+            heading = self.read_shaft_heading(heading_region, expected)
+            if heading is None and not self.find_image("mineshaft.png"):
+                logger.error("Not looking at a mineshaft, not maxing")
                 return
 
             # We're in a non-maxed shaft, let's try to click upgrade
             if self.find_image("upgrade.png", click=True):
-                logger.info("Maxing mine '%s'", text)
+                logger.info("Maxing mine %s", heading)
             else:
-                logger.info("%s already maxed", text)
+                logger.info("Mine %s already maxed", heading)
 
             # Mineshaft 1 Level 800
-            if "ft1lev" in text:
+            if heading is not None and heading[0] == 1:
                 logger.info("Done maxing everything!")
                 return
-            time.sleep(0.5)
+            self.settle(0.5, "upgrade")
             # We might have maxed first 5 only...
             # maxed_mineshafts = True
 
@@ -581,30 +2627,27 @@ class IdleMinerTycoon:
             return False
 
         # Look for arrow
-        upgradable = False
-        for i in range(0, 10, 3):
-            x, y = arrow_loc[0], arrow_loc[1] - i
-            if DEBUG:
-                pyautogui.moveTo(x, y)
-            pix = pyautogui.pixel(int(x), int(y))
-            if (self.colors["upgrade_arrow_left"] == pix
-                    or self.colors["upgrade_arrow_right"] == pix):
-                logger.debug("Found upgrade arrow")
-                upgradable = True
-                break
-        if not upgradable:
+        points = [(arrow_loc[0], arrow_loc[1] - i) for i in range(0, 10, 3)]
+        if DEBUG:
+            self.screen.move_to(points[0])
+        arrow_colors = ["upgrade_arrow_left", "upgrade_arrow_right"]
+        if self.colors.mask(self.screen.sample(points), arrow_colors).any():
+            logger.debug("Found upgrade arrow")
+        else:
             logger.debug("Upgrade arrow not found")
             return False
         if DEBUG:
-            pyautogui.moveTo(loc)
-        pyautogui.click(loc)
-        time.sleep(1)
+            self.screen.move_to(loc)
+        self.screen.click(loc)
+        self.settle(1, "level_panel")
+        if self.find_image("upgrade.png"):
+            self._learn_screen(Window.LEVEL_UP)
         self.find_image("max-selected.png", click=True)
         self.find_image("max-unselected.png", click=True)
-        time.sleep(0.5)
+        self.settle(0.5, "max_button")
         if self.find_image("upgrade.png", click=True):
-            self.last_upgrade_time = time.perf_counter()
-            time.sleep(0.5)
+            self.last_upgrade_time = clock()
+            self.settle(0.5, "upgrade")
 
         if self.find_image("maxed-upgrades.png"):
             if self.area_needs_leveling == MineArea.MINESHAFT:
@@ -614,89 +2657,118 @@ class IdleMinerTycoon:
             elif self.area_needs_leveling == MineArea.WAREHOUSE:
                 self.maxed_warehouse = True
 
-        pyautogui.press(["esc"])
-        time.sleep(1)
+        self.screen.press(["esc"])
+        self.settle(1, "esc")
 
-    def _find_next_mgr(self, area, mgr_name=None, boost=True):
+    def manager_name(self, text):
+        """The key in self.mgrs for a manager's name as OCR read it, or the cleaned text"""
+        text = "".join(c for c in text.lower() if c.isalnum())
+        name, distance = self.manager_names.match(text)
+        if name is None:
+            return text
+        if distance:
+            logger.debug("Read manager %s as %s", name, text)
+        return name
+
+    def _read_manager_page(self, area, page):
+        """Read the visible page of the manager list into the roster
+
+        Returns [(name, ready, assign button Match)], top to bottom.
+        """
         assign_buttons = self.locate_all("assign.png", confidence=0.7)
         if not assign_buttons:
             logger.error("No assign buttons found")
+            return []
+        logger.debug("%u assign buttons: %s", len(assign_buttons), assign_buttons)
+        # Grid of pixels below each assign button where the orange boost
+        # icon shows up, all read from the frame at once
+        grid = np.array([(xx, yy) for xx in range(0, 24, 4) for yy in range(0, 24, 4)])
+        grid += (round(30 * self.screen.scale), round(33 * self.screen.scale))
+        points = np.concatenate([grid + (b.left, b.top) for b in assign_buttons])
+        samples = self.screen.sample(points).reshape(len(assign_buttons), len(grid), 3)
+        orange = self.colors.mask(samples, ["cycle_orange", "cycle_orange_dark"])
+        rows = []
+        now = clock()
+        for i, assign_button in enumerate(assign_buttons):
+            pt = Point(assign_button.left, assign_button.top)
+            name = self.manager_name(Region(-120, -12, -20, 12, pt).ocr())
+            ready = bool(orange[i].any())
+            if name:
+                self.roster.see(area, name, page, ready, now)
+                self.manager_store.record("seen", area, name, page=page, ready=ready)
+            rows.append((name, ready, assign_button))
+        logger.debug("Managers on page %d: %s", page,
+                     ", ".join(f"{name}{'*' if ready else ''}" for name, ready, _ in rows))
+        return rows
+
+    def _assign_from_page(self, area, page, mgr_name=None, boost=True):
+        """Assign mgr_name, or the best ready manager, if it's on the visible page"""
+        rows = self._read_manager_page(area, page)
+        if mgr_name is None:
+            rows = [row for row in rows if row[1]]
+        else:
+            rows = [row for row in rows if row[0] == mgr_name]
+        if not rows:
             return False
+        name, _, assign_button = max(rows, key=lambda row: self.mgrs.get(row[0], 0))
+        logger.debug("Assigning %s from page %d", name, page)
+        self.roster.used(area, name, clock())
+        return self._assign_manager(area, assign_button, boost, name)
 
-        logger.debug("%u assign buttons: %s", len(assign_buttons), assign_buttons)
-        for assign_button in assign_buttons:
-            found_it = False
-            if DEBUG:
-                pyautogui.moveTo(assign_button)
-            if mgr_name is None:
-                # Find next SM that's ready
-                for xx in range(0, 24, 4):
-                    for yy in range(0, 24, 4):
-                        x_offset = round(30 * SCALE)
-                        y_offset = round(33 * SCALE)
-                        x = int(assign_button[0] + x_offset + xx)
-                        y = int(assign_button[1] + y_offset + yy)
-                        if DEBUG:
-                            # This takes a really long time
-                            pyautogui.moveTo(x, y)
-                        pix = pyautogui.pixel(x, y)
-                        if (
-                            self.colors["cycle_orange"] == pix
-                            or self.colors["cycle_orange_dark"] == pix
-                        ):
-                            found_it = True
-                            break
-                    if found_it:
-                        break
-                if not found_it:
-                    logger.debug("Doesn't look ready, moving to next mgr: %s", pix)
-                    continue
-                logger.debug("Looks ready, assigning mgr. pix=%s", pix)
-            else:
-                # Find manager by name
-                pt = Point(assign_button.left, assign_button.top)
-                mgr_name_region = Region(-120, -12, -20, 12, pt)
-                text = mgr_name_region.ocr()
-                logger.info("Manager name next to assign button: %s", text)
-                if mgr_name != text:
-                    logger.debug("Manager %s isn't %s", text, mgr_name)
-                    continue
-            # Assign manager
+    def _assign_manager(self, area, assign_button, boost=True, listed_name=None):
+        """Click a manager's assign button and boost them
+
+        listed_name is the name read from the list, what the roster and the
+        manager store know them by.
+        """
+        if DEBUG:
+            self.screen.move_to(assign_button[0], assign_button[1])
+        self.screen.click(assign_button[0], assign_button[1])
+        self.current_mgr[area]["known"] = False
+        self.current_mgr[area]["boosted"] = False
+        self.settle(1, "assign")
+        if (self.find_image("assign-anyway.png", click=True)
+                or self.find_image("assign-anyway2.png", click=True)):
+            self.settle(2, "assign_anyway")
+        # Find manager name
+        name_region = Region(145, 178, 242, 198)
+        mgr_name = self.manager_name(name_region.ocr())
+        if mgr_name in self.mgrs:
+            self.current_mgr[area]["known"] = True
+            active_time = self.mgrs[mgr_name] * 60  # convert min to sec
+        else:
+            active_time = 30  # minimum time
+        listed_name = listed_name or mgr_name
+        self.manager_store.record("assign", area, listed_name)
+        # Boost manager
+        if boost:
+            unassign_loc = self.find_image("unassign.png")
+            if unassign_loc is None:
+                logger.warning("Couldn't find unassign button")
+                return False
+            boost_loc_x = unassign_loc[0] + round(20 * self.screen.scale)
+            boost_loc_y = unassign_loc[1] + round(35 * self.screen.scale)
+            boost_loc = (boost_loc_x, boost_loc_y)
             if DEBUG:
-                pyautogui.moveTo(assign_button[0], assign_button[1])
-            pyautogui.click(assign_button[0], assign_button[1])
-            self.current_mgr[area]["known"] = False
-            self.current_mgr[area]["boosted"] = False
-            time.sleep(1)
-            if (self.find_image("assign-anyway.png", click=True)
-                    or self.find_image("assign-anyway2.png", click=True)):
-                time.sleep(2)
-            # Find manager name
-            name_region = Region(145, 178, 242, 198)
-            mgr_name = name_region.ocr()
-            if mgr_name in self.mgrs:
-                self.current_mgr[area]["known"] = True
-                active_time = self.mgrs[mgr_name] * 60  # convert min to sec
-            else:
-                active_time = 30  # minimum time
-            # Boost manager
-            if boost:
-                unassign_loc = self.find_image("unassign.png")
-                if unassign_loc is None:
-                    logger.warning("Couldn't find unassign button")
-                    continue
-                boost_loc_x = unassign_loc[0] + round(20 * SCALE)
-                boost_loc_y = unassign_loc[1] + round(35 * SCALE)
-                boost_loc = (boost_loc_x, boost_loc_y)
-                if DEBUG:
-                    pyautogui.moveTo(boost_loc)
-                logger.info("Boosting manager %s for %ds", mgr_name, active_time)
-                self.current_mgr[area]["boosted"] = True
-                pyautogui.click(boost_loc)
-                self.next_change_time[area] = time.perf_counter() + active_time
-            return True
-        logger.debug("No boostable managers found, need to scroll")
-        return False
+                self.screen.move_to(boost_loc)
+            logger.info("Boosting manager %s for %ds", mgr_name, active_time)
+            self.current_mgr[area]["boosted"] = True
+            self.screen.click(boost_loc)
+            self.next_change_time[area] = clock() + active_time
+            self.manager_store.record("boost", area, listed_name, duration=active_time)
+        return True
+
+    def _scroll_managers(self, pages):
+        """Drag the manager list down (or up if negative) a number of pages"""
+        for _ in range(abs(pages)):
+            # 115 is about 1 manager size chunk
+            drag_start = (
+                self.region_game.left + self.region_game.right // 2,
+                self.region_game.top + round((500 if pages > 0 else 300) * self.screen.scale),
+            )
+            offset = -200 if pages > 0 else 200
+            self.screen.drag(drag_start, (0, offset * self.screen.scale))
+            self.settle(3, "scroll_managers")
 
     def open_manager_window(self, area):
         """Open the manager window (by clicking on a manager in an area)"""
@@ -706,7 +2778,7 @@ class IdleMinerTycoon:
             if not mgr_loc:
                 logger.warning("Couldn't find last manager")
                 return False
-            pyautogui.click(mgr_loc)
+            self.screen.click(mgr_loc)
         elif area == MineArea.ELEVATOR:
             self.goto_mineshaft_top()
             mgr_loc = Loc(53, 405)
@@ -733,42 +2805,51 @@ class IdleMinerTycoon:
         for img in super_manager_tabs:
             loc = self.find_image(img)
             if loc is not None:
-                pyautogui.click(loc)
+                self.screen.click(loc)
                 break
 
-        # Find next manager with orange below assign button
-        scrolls = 5
+        pages = 5
         if area in (MineArea.WAREHOUSE, MineArea.ELEVATOR):
-            scrolls = 4
+            pages = 4
+        page = 0
         boosted = False
-        for i in range(scrolls):
-            if not self.verify_in_manager_window(MineArea.MINESHAFT):
-                logger.error("Not in Mineshaft Manager window")
-                break
-
-            if self._find_next_mgr(area, mgr_name=mgr_name, boost=boost):
-                boosted = True
-                break
-
-            # Scroll
-            if i == scrolls - 1:
-                # Don't scroll on the last iteration
-                break
-            drag_start = (
-                self.region_game.left + self.region_game.right // 2,
-                self.region_game.top + round(500 * SCALE),
-            )
-            # 115 is about 1 manager size chunk
-            pyautogui.moveTo(drag_start)
-            time.sleep(0.5)
-            pyautogui.dragRel(xOffset=0, yOffset=(-200 * SCALE), duration=2)
-            time.sleep(3)
-            logger.debug("trying again...")
+        self._refresh_roster(area)
+        best = None if mgr_name else self.roster.best(area, self.mgrs, clock())
+        if best is not None:
+            # Straight to the page the best ready manager was on
+            name, entry = best
+            logger.debug("Scrolling to %s on page %d", name, entry["page"])
+            self._scroll_managers(entry["page"])
+            page = entry["page"]
+            boosted = self._assign_from_page(area, page, boost=boost)
+        if not boosted:
+            # Scan the whole list into the roster, from the top
+            self._scroll_managers(-page)
+            for page in range(pages):
+                if not self.verify_in_manager_window(MineArea.MINESHAFT):
+                    logger.error("Not in Mineshaft Manager window")
+                    break
+                if mgr_name is None:
+                    self._read_manager_page(area, page)
+                elif self._assign_from_page(area, page, mgr_name, boost):
+                    boosted = True
+                    break
+                if page < pages - 1:  # Don't scroll after the last page
+                    self._scroll_managers(1)
+            self.roster.scanned[area] = clock()
+            self.manager_store.record("scan", area)
+        if not boosted and mgr_name is None:
+            best = self.roster.best(area, self.mgrs, clock())
+            if best is not None:
+                name, entry = best
+                logger.debug("Going back to %s on page %d", name, entry["page"])
+                self._scroll_managers(entry["page"] - page)
+                boosted = self._assign_from_page(area, entry["page"], boost=boost)
         if not boosted:
             logger.info("No boostable manager found, waiting 2 min")
-            self.next_change_time[area] = time.perf_counter() + 2*60
-        pyautogui.press(["esc"])
-        time.sleep(1)
+            self.next_change_time[area] = clock() + 2*60
+        self.screen.press(["esc"])
+        self.settle(1, "esc")
         return
 
     def cycle_managers(self):
@@ -777,7 +2858,7 @@ class IdleMinerTycoon:
             logger.debug("Not cycling managers for %s mode", self.mine.name)
             return False
         for area in (MineArea.MINESHAFT, MineArea.ELEVATOR, MineArea.WAREHOUSE):
-            now = time.perf_counter()
+            now = clock()
             next_time = self.next_change_time[area]
             delta = abs(now - next_time)
             if now < next_time:
@@ -788,34 +2869,46 @@ class IdleMinerTycoon:
             if not self.current_mgr[area]["known"] and self.current_mgr[area]["boosted"]:
                 logger.warning("Unknown manager in %s is still boosted", area.name)
                 continue
+            # Don't open the manager window until someone should be ready
+            ready = self.manager_store.next_ready(area)
+            if ready is not None and ready > time.time():
+                logger.debug("No %s manager ready for %ds", area.name, ready - time.time())
+                self.next_change_time[area] = self._from_wall(ready)
+                continue
             self._cycle_managers(area, boost=True)
-            self.edgar()
+            if not self.edgar_watcher:
+                self.edgar()
 
     def edgar(self):
         """Search for edgar and click"""
         logger.debug("Searching for Edgar")
-        # edgar_region = Region(355, 900, 560, 1060)
-        edgar_region = Region(228, 578, 359, 680)
-        now = time.perf_counter()
+        now = clock()
         search_delta = self.last_edgar_search_time - now
         if search_delta > 5:
             logger.info("took %u seconds between edgar searches", search_delta)
         self.last_edgar_search_time = now
 
-        e = self.find_image("edgar.png", click=True, region=edgar_region)
-        e2 = self.find_image("edgar-extravaganza.png", click=True, region=edgar_region)
+        e = self.find_image("edgar.png", click=True, region=self.region_edgar)
+        e2 = self.find_image("edgar-extravaganza.png", click=True, region=self.region_edgar)
         if e or e2:
-            self.last_edgar_time = time.perf_counter()
-            # If we clicked edgar, wait 5 seconds for free button
-            end_time = time.perf_counter() + 5
-            while time.perf_counter() < end_time:
-                if self.find_image("free.png", click=True):
-                    logger.info("Found edgar")
-                    time.sleep(5)
-                    break
-                time.sleep(0.25)
+            self.claim_edgar()
+        self.check_edgar_overdue()
+
+    def claim_edgar(self):
+        """After clicking Edgar, wait 5 seconds for the free button and click it"""
+        self.last_edgar_time = clock()
+        end_time = clock() + 5
+        while clock() < end_time:
+            if self.find_image("free.png", click=True):
+                logger.info("Found edgar")
+                self.settle(5, "edgar")
+                break
+            sleep(0.25)
+            self.screen.invalidate()
 
-        now = time.perf_counter()
+    def check_edgar_overdue(self):
+        """Warn if Edgar hasn't been seen for a long time"""
+        now = clock()
         if now > self.last_edgar_time + 30 * 60:
             minutes_since = (now - self.last_edgar_time) // 60
             logger.warning("Haven't seen edgar in %d minutes", minutes_since)
@@ -836,17 +2929,17 @@ class IdleMinerTycoon:
 
             # might need to check a few pixels
             check_pixel = int(loc[0] - 5), int(loc[1] - 5)
-            pix = pyautogui.pixel(check_pixel[0], check_pixel[1])
+            pix = self.screen.pixel(check_pixel[0], check_pixel[1])
             if DEBUG:
-                pyautogui.moveTo(check_pixel)
+                self.screen.move_to(check_pixel)
 
             if pix != new_shaft_blue:
                 logger.debug("New shaft button isn't the right color: %s", pix)
                 return
 
             logger.info("Opening new shaft")
-            pyautogui.click(loc)
-            time.sleep(3)
+            self.screen.click(loc)
+            self.settle(3, "new_shaft")
             self.hire_last_manager()
 
     def hire_last_manager(self):
@@ -855,14 +2948,14 @@ class IdleMinerTycoon:
         loc = self.find_last_manager()
         if not loc:
             return
-        pyautogui.click(loc)
-        time.sleep(2)
+        self.screen.click(loc)
+        self.settle(2, "manager_panel")
 
         # It is ok if this doesn't work
         loc = self.locate_center("dollar-mgr-tab.png")
         if loc:
-            pyautogui.click(loc)
-            time.sleep(0.5)
+            self.screen.click(loc)
+            self.settle(0.5, "manager_tab")
 
         loc = self.locate_center("hire-manager-button.png")
         if not loc:
@@ -870,10 +2963,10 @@ class IdleMinerTycoon:
             loc = self.locate_center("hire-manager-button2.png")
         if not loc:
             logger.error("Can't find hire button")
-        pyautogui.click(loc)
+        self.screen.click(loc)
         logger.info("Hired manager")
-        time.sleep(0.5)
-        pyautogui.press(["esc"])
+        self.settle(0.5, "hire")
+        self.screen.press(["esc"])
 
     def unlock_barrier(self):
         """Unlock any barrier that can be unlocked"""
@@ -881,9 +2974,9 @@ class IdleMinerTycoon:
         self.goto_mineshaft_bottom()
         loc = self.locate_center("remove-barrier.png")
         if loc:
-            pyautogui.click(loc[0] - 5, loc[1] - 5)
+            self.screen.click(loc[0] - 5, loc[1] - 5)
             logger.info("Unlocking barrier!")
-            time.sleep(1)
+            self.settle(1, "barrier")
 
         # Skip timers, too
         self.find_image("skip-no-time.png", click=True)
@@ -910,45 +3003,96 @@ class IdleMinerTycoon:
         for _ in range(5):
             if self.verify_in_shaft():
                 return
-            for img in [
+            self.click_images([
                 "free.png", "free-idle.png", "skip-no-time.png",
                 "collect.png", "x.png", "x2.png", "x3.png", "x4.png",
                 "red-x.png", "cancel.png",
-            ]:
-                if self.find_image(img, click=True):
-                    time.sleep(2)
-            pyautogui.press(["esc"])
-            time.sleep(2)
+            ], wait=2)
+            self.screen.press(["esc"])
+            self.settle(2, "esc")
             self.find_image_timeout("cancel.png", click=True, timeout=5)
 
     def start_game(self):
         """Open the game from the bluestacks app menu"""
         if self.find_image("idle-miner.png", click=True):
-            time.sleep(30)
+            self.settle(30, "start_game", min_wait=5)
             self.close_popups()
             self.discover_location()
 
+    def settle(self, max_wait, label, min_wait=0.1):
+        """Wait for the game region to stop changing after an action"""
+        return self.screen.wait_until_stable(
+            self.region_game.box(), max_wait, min_wait=min_wait, label=label)
+
+    def sweep_buttons(self):
+        """Click any of the buttons that should always be clicked"""
+        self.click_images(self.sweep_images())
+
+    def sweep_images(self):
+        """The buttons sweep_buttons clicks, in order"""
+        return list(dict.fromkeys(self.always_buttons + ['cancel.png', 'red-x.png']))
+
+    def tasks(self):
+        """Everything play() does, with how often and how much it's worth"""
+        tasks = [
+            Task("start_game", self.start_game, interval=30),
+            Task("sweep_buttons", self.sweep_buttons, interval=5, value=2),
+            Task("edgar", self.edgar, interval=10, value=3),
+            # No point looking right after spending money on an upgrade
+            Task("level_up", self.level_up, interval=30, value=5,
+                 deadline=lambda: self.last_upgrade_time + 60),
+            Task("new_shaft", self.new_shaft, interval=120, value=4),
+            Task("unlock_barrier", self.unlock_barrier, interval=120, value=4),
+            Task("cycle_managers", self.cycle_managers, interval=20, value=5,
+                 deadline=lambda: min(self.next_change_time.values())),
+        ]
+        if self.edgar_watcher:  # Watched on its own thread instead
+            tasks = [task for task in tasks if task.name != "edgar"]
+        return tasks
+
     def play(self):
         """Run the game"""
+        use_screen(self.screen)
+        if not self.pipeline:
+            self._play()
+            return
+        # The sweep is looked for on every frame, so it's ready when it runs
+        images = self.sweep_images()
+        self.pipeline.watch(self._find_images_key(images, None, None),
+                            functools.partial(self._find_images, images, None, None,
+                                              throttle=True))
+        self.pipeline.start()
+        self.edgar_watcher.start()
+        try:
+            self._play()
+        finally:
+            self.edgar_watcher.stop()
+            self.pipeline.stop()
+
+    def _play(self):
         iteration = 1
-        self.discover_location()
+        with startup_phase("discover_location"):
+            self.discover_location()
+        scheduler = Scheduler(self.tasks())
         while True:
             # Every N cycles, make sure we're still in the expected mine
             # if iteration % 50 == 0:
                 # win32gui.EnumWindows(window_callback, None)
                 # self.discover_location()
-            self.start_game()
-            for img in self.always_buttons + ['cancel.png', 'red-x.png']:
-                self.find_image(img, click=True)
-            self.edgar()
-            self.level_up()
-            self.edgar()
-            self.new_shaft()
-            self.unlock_barrier()
-            self.edgar()
-            self.cycle_managers()
-            self.edgar()
+            task = scheduler.run_once()
+            if not task:
+                continue
             iteration += 1
+            budget = METRICS.end_iteration(task.name)
+            logger.debug("%s took %.2fs: %.2fs work, %.2fs sleep, %.2fs ui_wait, "
+                         "%.2fs debug", task.name, budget["total"], budget["work"],
+                         budget["sleep"], budget["ui_wait"], budget["debug"])
+            if iteration % 50 == 0:  # Once per 50 tasks, not per idle scheduler pass
+                logger.info("OCR cache: %d hits, %d misses",
+                            OCR_CACHE.hits, OCR_CACHE.misses)
+                for label, stats in sorted(self.screen.transition_stats().items()):
+                    logger.info("Settle %s: %d waits, mean %.2fs, max %.2fs, %d timeouts",
+                                label, *stats)
 
     def test(self):
         """Function to test a single feature when run with --test"""
@@ -965,23 +3109,103 @@ class IdleMinerTycoon:
         # for area in (MineArea.ELEVATOR, MineArea.WAREHOUSE, MineArea.MINESHAFT):
         #     self.open_manager_window(area)
         #     print("verify_in_manager_window: %s" % self.verify_in_manager_window(area))
-        #     pyautogui.press(["esc"])
-        #     time.sleep(0.5)
+        #     self.screen.press(["esc"])
+        #     sleep(0.5)
         # print(f"open_mine_overview: {self.open_mine_overview()})
         # print(f"verify_in_mine_overview: {self.verify_in_mine_overview()}")
         print(f"verify_in_shaft: {self.verify_in_shaft()}")
 
 
+class Supervisor:
+    """Run several bots at once, one thread per Bluestacks window
+
+    Templates and the OCR engine are shared, and the bots take turns with
+    the mouse and keyboard through INPUT_LOCK.
+    """
+
+    def __init__(self, bots):
+        self.bots = bots
+
+    @classmethod
+    def discover(cls, width=None, pipeline=True):
+        """A bot for every Bluestacks window, with the windows tiled left to right"""
+        bots = []
+        names = set()
+        x = 0
+        for hwnd, title, (left, _, right, _) in find_windows():
+            backend = WindowsBackend(hwnd, position=(x, 0), width=width)
+            # Each window is its own game, named after its title in the manager store
+            base = name = "".join(c if c.isalnum() else "-" for c in title.lower())
+            count = 1
+            while name in names:  # Windows sharing a title mustn't share a store
+                count += 1
+                name = f"{base}-{count}"
+            if name != base:
+                logger.warning("Another window already stores as %s, storing '%s' as %s. "
+                               "Give the windows unique titles to keep their stores apart "
+                               "between runs.", base, title, name)
+            names.add(name)
+            bots.append(IdleMinerTycoon(connect(backend), pipeline, name))
+            x += width or right - left
+        logger.info("Supervising %d bots", len(bots))
+        return cls(bots)
+
+    def _run(self, bot):
+        """Thread body, one bot crashing doesn't stop the others"""
+        try:
+            bot.play()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Bot crashed")
+
+    def run(self):
+        """Play every bot until they all stop"""
+        threads = [
+            threading.Thread(target=self._run, args=(bot,), name=f"bot-{i}", daemon=True)
+            for i, bot in enumerate(self.bots)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
 def play():
     """Entry point"""
     parser = argparse.ArgumentParser()
     parser.add_argument("--test", action='store_true')
+    parser.add_argument("--replay", metavar="DIR",
+                        help="Run against recorded frames instead of Bluestacks")
+    parser.add_argument("--record", metavar="DIR",
+                        help="Save every frame and OCR result for --replay")
+    parser.add_argument("--instances", action='store_true',
+                        help="Play every Bluestacks window at once")
+    parser.add_argument("--metrics", metavar="DIR",
+                        help="Write metrics.jsonl and metrics.prom here")
+    parser.add_argument("--no-pipeline", action='store_true',
+                        help="No capture, detection or Edgar threads, do it all in turn")
+    parser.add_argument("--width", type=int,
+                        help="Resize Bluestacks to this width, smaller is faster")
     args = parser.parse_args()
-    imt = IdleMinerTycoon()
-    if args.test:
-        imt.test()
-    else:
-        imt.play()
+    if args.metrics:
+        os.makedirs(args.metrics, exist_ok=True)
+        METRICS.jsonl_path = os.path.join(args.metrics, "metrics.jsonl")
+        METRICS.prometheus_path = os.path.join(args.metrics, "metrics.prom")
+    if args.instances:
+        Supervisor.discover(args.width, not args.no_pipeline).run()
+        return
+    backend = ReplayBackend(args.replay) if args.replay else WindowsBackend(width=args.width)
+    if args.record:
+        backend = RecordingBackend(backend, args.record)
+    # Replays advance on input, a capture thread would skip through them
+    imt = IdleMinerTycoon(connect(backend), pipeline=not (args.replay or args.no_pipeline),
+                          name="replay" if args.replay else "default")
+    try:
+        if args.test:
+            imt.test()
+        else:
+            imt.play()
+    except ReplayFinished as e:
+        logger.info("%s", e)
 
 
 if __name__ == "__main__":
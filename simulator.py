@@ -0,0 +1,180 @@
+"""Simulate the mine economy offline to compare leveling and manager strategies
+
+Every strategy in the grid is simulated at once, as one row of NumPy arrays:
+
+- Each area (mineshaft, elevator, warehouse) moves ore at a rate that grows
+  with its level. Income is the slowest of the three.
+- A boosted area moves boost times as much. Each super manager in
+  SUPER_MANAGERS boosts their area for their listed minutes and then cools
+  down.
+- Every check_interval seconds, an area whose boost ran out gets a ready
+  manager, or is left alone for backoff seconds if none is ready.
+- Every level_interval seconds, all the money goes into one area, picked
+  by the leveling policy.
+
+The economy constants are rough guesses. Compare strategies against each
+other, not against the game's real numbers.
+
+python -m idle_miner_tycoon.simulator --hours 24 --backoff 60 120 300
+"""
+import argparse
+import itertools
+import time
+from collections import namedtuple
+import numpy as np
+from . import idle_miner_tycoon as imt
+
+AREAS = list(imt.MineArea)
+# Ore per second at level 0, and the factor per level, by area; the cost of
+# the first upgrade and the factor per level; and what a boost multiplies
+Economy = namedtuple("Economy", [
+    "base_rate", "rate_growth", "base_cost", "cost_growth", "boost",
+])
+ECONOMY = Economy(
+    base_rate=(10.0, 12.0, 11.0), rate_growth=(1.09, 1.08, 1.08),
+    base_cost=(100.0, 120.0, 110.0), cost_growth=(1.12, 1.12, 1.12),
+    boost=3.0,
+)
+LEVELING = ("bottleneck", "cheapest", "round_robin")
+MANAGER_PICKS = ("longest", "first")
+Strategy = namedtuple("Strategy", [
+    "leveling", "manager_pick", "check_interval", "level_interval", "backoff", "cooldown",
+])
+
+
+def manager_table():
+    """(boost seconds, valid) arrays of shape (areas, most managers in an area)"""
+    most = max(len(managers) for managers in imt.SUPER_MANAGERS.values())
+    durations = np.zeros((len(AREAS), most))
+    valid = np.zeros((len(AREAS), most), dtype=bool)
+    for a, area in enumerate(AREAS):
+        minutes = list(imt.SUPER_MANAGERS[area].values())
+        durations[a, :len(minutes)] = np.array(minutes) * 60
+        valid[a, :len(minutes)] = True
+    return durations, valid
+
+
+def next_tick(t, interval):
+    """The first multiple of interval at or after t, when the bot next looks"""
+    return np.ceil(t / interval) * interval
+
+
+def simulate(strategies, hours=24.0, dt=5.0, economy=ECONOMY):
+    """Run every Strategy for hours, return a dict of per-strategy arrays"""
+    n = len(strategies)
+    column = {field: np.array([getattr(s, field) for s in strategies])
+              for field in Strategy._fields}
+    base_rate = np.array(economy.base_rate)
+    log_rate_growth = np.log(economy.rate_growth)
+    base_cost = np.array(economy.base_cost)
+    cost_growth = np.array(economy.cost_growth)
+    durations, valid = manager_table()
+    longest = (column["manager_pick"] == "longest")[:, np.newaxis, np.newaxis]
+    # What picking a manager maximises: their boost length, or being early in the list
+    preference = np.where(longest, durations, -np.arange(durations.shape[1]))
+    leveling = {policy: column["leveling"] == policy for policy in LEVELING}
+    rows = np.arange(n)
+
+    levels = np.zeros((n, len(AREAS)))
+    money = np.zeros(n)
+    earned = np.zeros(n)
+    boosted_time = np.zeros((n, len(AREAS)))
+    ready_at = np.zeros((n,) + durations.shape)
+    active_until = np.zeros((n, len(AREAS)))
+    next_check = np.zeros((n, len(AREAS)))
+    next_level = np.zeros(n)
+    turn = np.zeros(n, dtype=int)
+
+    for step in range(int(hours * 3600 / dt)):
+        t = step * dt
+        rates = base_rate * np.exp(levels * log_rate_growth)
+        boosted = active_until > t
+        income = np.where(boosted, rates * economy.boost, rates).min(axis=1) * dt
+        money += income
+        earned += income
+        boosted_time += boosted * dt
+
+        due = (next_check <= t) & ~boosted
+        if due.any():
+            ready = (ready_at <= t) & valid
+            pick = np.where(ready, preference, -np.inf).argmax(axis=2)
+            start = due & ready.any(axis=2)
+            p, a = np.nonzero(start)
+            k = pick[start]
+            active_until[p, a] = t + durations[a, k]
+            ready_at[p, a, k] = t + durations[a, k] + column["cooldown"][p]
+            next_check[p, a] = next_tick(active_until[p, a], column["check_interval"][p])
+            p, a = np.nonzero(due & ~start)
+            next_check[p, a] = next_tick(t + column["backoff"][p], column["check_interval"][p])
+
+        due = next_level <= t
+        if due.any():
+            costs = base_cost * cost_growth ** levels
+            area = np.where(leveling["bottleneck"], rates.argmin(axis=1),
+                            np.where(leveling["cheapest"], costs.argmin(axis=1),
+                                     turn % len(AREAS)))
+            cost = costs[rows, area]
+            growth = cost_growth[area]
+            # As many levels as the money buys, like the max button
+            bought = np.floor(np.log1p(money * (growth - 1) / cost) / np.log(growth))
+            bought = np.where(due, bought, 0)
+            money -= cost * (growth ** bought - 1) / (growth - 1)
+            levels[rows, area] += bought
+            turn += due & leveling["round_robin"]
+            next_level[due] = t + column["level_interval"][due]
+
+    return {
+        "income_per_hour": earned / hours,
+        "boosted": boosted_time / (hours * 3600),
+        "levels": levels,
+    }
+
+
+def grid(args):
+    """Every combination of the strategy options on the command line"""
+    return [Strategy(*values) for values in itertools.product(
+        args.leveling, args.manager_pick, args.check_interval, args.level_interval,
+        args.backoff, args.cooldown)]
+
+
+def report(strategies, results, top):
+    """Print the best strategies by income per hour"""
+    order = np.argsort(-results["income_per_hour"])[:top]
+    print(f"{'income/h':>12} {'leveling':<12} {'pick':<8} {'check':>6} {'level':>6} "
+          f"{'backoff':>8} {'cooldown':>9}  boosted (shaft/elev/ware)  levels")
+    for i in order:
+        s = strategies[i]
+        boosted = "/".join(f"{b:.0%}" for b in results["boosted"][i])
+        levels = "/".join(f"{level:.0f}" for level in results["levels"][i])
+        print(f"{results['income_per_hour'][i]:12.4g} {s.leveling:<12} {s.manager_pick:<8} "
+              f"{s.check_interval:6g} {s.level_interval:6g} {s.backoff:8g} {s.cooldown:9g}  "
+              f"{boosted:<26} {levels}")
+
+
+def main():
+    """Entry point"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--dt", type=float, default=5, help="Seconds per step")
+    parser.add_argument("--leveling", nargs="+", choices=LEVELING, default=list(LEVELING))
+    parser.add_argument("--manager-pick", nargs="+", choices=MANAGER_PICKS,
+                        default=list(MANAGER_PICKS))
+    parser.add_argument("--check-interval", nargs="+", type=float, default=[20, 60])
+    parser.add_argument("--level-interval", nargs="+", type=float, default=[30, 120])
+    parser.add_argument("--backoff", nargs="+", type=float, default=[120, 600])
+    parser.add_argument("--cooldown", nargs="+", type=float, default=[60 * 60],
+                        help="Seconds before a super manager can boost again")
+    parser.add_argument("--top", type=int, default=20, help="Strategies to print")
+    args = parser.parse_args()
+
+    strategies = grid(args)
+    start = time.perf_counter()
+    results = simulate(strategies, args.hours, args.dt)
+    elapsed = time.perf_counter() - start
+    report(strategies, results, args.top)
+    print(f"\n{len(strategies)} strategies x {args.hours:g}h in {elapsed:.2f}s, "
+          f"{len(strategies) * args.hours / elapsed:.0f} simulated hours per second")
+
+
+if __name__ == "__main__":
+    main()